@@ -1,31 +1,146 @@
 from typing import Any
-import requests
-import json
-from .exceptions import ApiError
+import os
+import time
+import logging
+import copy
+from .exceptions import ApiError, DeadlineExceededError
+from .deadline import NO_DEADLINE, DEADLINE_MIN_CALL
+from . import transport
+from . import ratelimit
+from . import tracing
+from . import serialization
+
+# Overridable so the client can be pointed at a local stand-in (see benchmarks/fake_ghl.py).
+BASE_URL = os.environ.get('GHL_BASE_URL', 'https://rest.gohighlevel.com/v1')
+
+
+def not_sent(error):
+    """
+    True when a requests exception shows the request never reached GHL: the connection
+    timed out, was refused or the host could not be resolved.
+    """
+    import requests.exceptions
+    import urllib3.exceptions
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    return isinstance(getattr(error.args[0], 'reason', None), urllib3.exceptions.NewConnectionError)
+
 
 class GHL:
 
-    def __init__(self, agency_api_key, location_id) -> None:
+    def __init__(self, agency_api_key, location_id, session=None, timeout=None, base_url=None,
+                 deadline=None) -> None:
         self.agency_api_key = agency_api_key
+        # Shared keep-alive pool, reused across instances and warm invocations.
+        self.session = session if session is not None else transport.get_session()
+        self.timeout = timeout if timeout is not None else transport.default_timeout()
+        # Request budget (deadline.Deadline) capping every call made through this client.
+        self.deadline = deadline if deadline is not None else NO_DEADLINE
         self.location_id = location_id
         self.location_api_key = agency_api_key
-        self.get_location_ep = f'https://rest.gohighlevel.com/v1/locations/{self.location_id}'
-        self.contact_ep = 'https://rest.gohighlevel.com/v1/contacts/{}'
-        self.contact_lookup_ep = 'https://rest.gohighlevel.com/v1/contacts/lookup?'
-        self.custom_fields_ep = "https://rest.gohighlevel.com/v1/custom-fields/"
-        self.notes_ep = "https://rest.gohighlevel.com/v1/contacts/{}/notes/"
-        self.pipelines_ep = "https://rest.gohighlevel.com/v1/pipelines/"
-        self.opportunities_ep = "https://rest.gohighlevel.com/v1/pipelines/{}/opportunities"
+        base_url = base_url or BASE_URL
+        self.get_location_ep = f'{base_url}/locations/{self.location_id}'
+        self.contact_ep = base_url + '/contacts/{}'
+        self.contact_lookup_ep = f'{base_url}/contacts/lookup?'
+        self.custom_fields_ep = f"{base_url}/custom-fields/"
+        self.notes_ep = base_url + "/contacts/{}/notes/"
+        self.pipelines_ep = f"{base_url}/pipelines/"
+        self.opportunities_ep = base_url + "/pipelines/{}/opportunities"
+        # Rate limiter and circuit breaker are shared by all clients of the location.
+        self.limiter = ratelimit.limiter_for(location_id)
+
+    def with_deadline(self, deadline):
+        """
+        Returns a copy of the client bound to another request budget (NO_DEADLINE for none).
+        """
+        client = copy.copy(self)
+        client.deadline = deadline
+        return client
+
+    def _call_timeout(self):
+        connect, read = self.timeout
+        return (self.deadline.timeout(connect), self.deadline.timeout(read))
+
+    def _fits(self, delay):
+        """
+        True when a retry after `delay` seconds still leaves time for the call itself.
+        """
+        return self.deadline.allows(delay + DEADLINE_MIN_CALL)
+
+    def _request(self, method, url, headers, data=None, idempotent=True, endpoint=None):
+        """
+        Sends one request through the location's rate limiter and circuit breaker.
+        429 and 5xx responses and network errors are retried with jittered exponential
+        backoff. Non-idempotent calls (creates) are only retried when GHL cannot have
+        processed them: on 429 and when the connection could not be established.
+        Timeouts, rate-limit waits and backoff are capped by the client's deadline; a retry
+        that would not fit in the remaining budget is not attempted.
+        The whole call, retries included, is reported as one "ghl.request" span.
+        """
+        # Imported per call (a sys.modules lookup once the session exists) so that main.py's
+        # import does not load requests; see transport.get_session.
+        import requests.exceptions
+        with tracing.span("ghl.request", location_id=self.location_id, endpoint=endpoint, method=method,
+                          payload_bytes=len(data) if data else 0) as trace:
+            breaker = self.limiter.breaker
+            trial = breaker.before_call(self.location_id)
+            recorded = False
+            try:
+                attempt = 0
+                while True:
+                    attempt += 1
+                    trace.set(retries=attempt - 1)
+                    self.limiter.bucket.acquire(max_wait=min(ratelimit.RATE_LIMIT_MAX_WAIT, self.deadline.remaining()))
+                    timeout = self._call_timeout()
+                    try:
+                        response = self.session.request(method, url=url, headers=headers, data=data, timeout=timeout)
+                    except requests.exceptions.RequestException as e:
+                        retryable = idempotent or not_sent(e)
+                        delay = ratelimit.backoff_delay(attempt)
+                        if isinstance(e, requests.exceptions.Timeout) and not self._fits(0):
+                            # Cut short by the request budget, not necessarily a failing endpoint.
+                            raise DeadlineExceededError(self.deadline.budget) from e
+                        if not retryable or attempt >= ratelimit.RETRY_MAX_ATTEMPTS or not self._fits(delay):
+                            breaker.record_failure()
+                            recorded = True
+                            raise
+                        logging.warning(f"{method} {url} failed ({e.__class__.__name__}), retry {attempt} in {delay:.2f}s")
+                        time.sleep(delay)
+                        continue
+
+                    self.limiter.bucket.update_from_headers(response.headers)
+                    status = response.status_code
+                    retryable = status == 429 or (idempotent and status in ratelimit.RETRYABLE_STATUS)
+                    delay = ratelimit.backoff_delay(attempt, response.headers.get('Retry-After')) if retryable else 0
+                    if not retryable or attempt >= ratelimit.RETRY_MAX_ATTEMPTS or not self._fits(delay):
+                        if status >= 500:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                        recorded = True
+                        trace.set(status=status, response_bytes=len(response.content))
+                        return response
+                    if status == 429:
+                        self.limiter.bucket.drain(delay)
+                    logging.warning(f"{method} {url} returned {status}, retry {attempt} in {delay:.2f}s")
+                    time.sleep(delay)
+            finally:
+                # A trial that ended without an outcome (rate-limit give-up, deadline) is
+                # released so the next call can be the trial.
+                if trial and not recorded:
+                    breaker.release_trial()
 
     def get_location(self):
         headers = {
             'Authorization': f'Bearer {self.agency_api_key}'
         }
-        request = requests.get(url=self.get_location_ep,
-                               headers=headers)
+        request = self._request('GET', self.get_location_ep, headers, endpoint='get_location')
+        body = serialization.loads(request.content)
         if request.status_code == 200:
-            return request.json()
-        raise ApiError(request.status_code, list(request.json().values())[0]["message"] + " status code: {}")
+            return body
+        raise ApiError(request.status_code, list(body.values())[0]["message"] + " status code: {}")
 
     def get_custom_fields(self):
         custom_fields_data = []
@@ -34,14 +149,15 @@ class GHL:
         headers = {
             'Authorization': f'Bearer {self.location_api_key}'
         }
-        response = requests.get(url=self.custom_fields_ep, headers=headers)
+        response = self._request('GET', self.custom_fields_ep, headers, endpoint='get_custom_fields')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        if 'customFields' in response.json():
-            custom_fields_data = response.json()
+        body = serialization.loads(response.content)
+        if 'customFields' in body:
+            custom_fields_data = body['customFields']
         if len(custom_fields_data) == 0:
             return None
-        return custom_fields_data['customFields']
+        return custom_fields_data
 
     def contact_lookup(self, query_params):
         contact_data = []
@@ -51,13 +167,14 @@ class GHL:
             'Authorization': f'Bearer {self.location_api_key}'
         }
         url = self.contact_lookup_ep + query_params
-        response = requests.get(url=url, headers=headers)
+        response = self._request('GET', url, headers, endpoint='contact_lookup')
         if response.status_code != 200:
             if response.status_code == 422:
                 return None
             raise ApiError(response.status_code)
-        if 'contacts' in response.json():
-            contact_data = response.json()['contacts']
+        body = serialization.loads(response.content)
+        if 'contacts' in body:
+            contact_data = body['contacts']
         if len(contact_data) == 0:
             return None
         return contact_data[0]
@@ -71,11 +188,11 @@ class GHL:
             'Content-Type': 'application/json'
         }
         url = self.contact_ep.format(contact_id)
-        payload = json.dumps(data)
-        response = requests.put(url=url, headers=headers, data=payload)
+        payload = serialization.dumps(data)
+        response = self._request('PUT', url, headers, payload, endpoint='update_contact')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        contact_data = response.json()
+        contact_data = serialization.loads(response.content)
         return contact_data
 
     def create_contact(self, data):
@@ -87,11 +204,11 @@ class GHL:
             'Content-Type': 'application/json'
         }
         url = self.contact_ep.format('')
-        payload = json.dumps(data)
-        response = requests.post(url=url, headers=headers, data=payload)
+        payload = serialization.dumps(data)
+        response = self._request('POST', url, headers, payload, idempotent=False, endpoint='create_contact')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        contact_data = response.json()
+        contact_data = serialization.loads(response.content)
         return contact_data
 
     def add_notes(self, contact_id, notes, user_id):
@@ -103,14 +220,14 @@ class GHL:
             'Content-Type': 'application/json'
         }
         url = self.notes_ep.format(contact_id)
-        payload = json.dumps({
-            "body": notes,
-            "userID": user_id
-        })
-        response = requests.post(url=url, headers=headers, data=payload)
+        note = {"body": notes}
+        if user_id:
+            note["userID"] = user_id
+        payload = serialization.dumps(note)
+        response = self._request('POST', url, headers, payload, idempotent=False, endpoint='add_notes')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        notes_data = response.json()
+        notes_data = serialization.loads(response.content)
         return notes_data
 
     def get_pipelines(self):
@@ -119,11 +236,12 @@ class GHL:
         )['apiKey'] if self.location_api_key is None else self.location_api_key
         headers = { 'Authorization': f'Bearer {self.location_api_key}' }
         url = self.pipelines_ep
-        response = requests.get(url=url, headers=headers)
+        response = self._request('GET', url, headers, endpoint='get_pipelines')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        if 'pipelines' in response.json():
-            pipelines_data = response.json()['pipelines']
+        body = serialization.loads(response.content)
+        if 'pipelines' in body:
+            pipelines_data = body['pipelines']
         if len(pipelines_data) == 0:
             return None
         return pipelines_data
@@ -134,11 +252,12 @@ class GHL:
         )['apiKey'] if self.location_api_key is None else self.location_api_key
         headers = { 'Authorization': f'Bearer {self.location_api_key}' }
         url = self.opportunities_ep.format(pipeline_id) + '?query=' + query_params if query_params else self.opportunities_ep.format(pipeline_id)
-        response = requests.get(url=url, headers=headers)
+        response = self._request('GET', url, headers, endpoint='get_opportunities')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        if 'opportunities' in response.json():
-            opportunities_data = response.json()['opportunities']
+        body = serialization.loads(response.content)
+        if 'opportunities' in body:
+            opportunities_data = body['opportunities']
         if len(opportunities_data) == 0:
             return None
         return opportunities_data
@@ -152,11 +271,11 @@ class GHL:
             'Content-Type': 'application/json'
         }
         url = self.opportunities_ep.format(pipeline_id) + '/'
-        payload = json.dumps(data)
-        response = requests.post(url=url, headers=headers, data=payload)
+        payload = serialization.dumps(data)
+        response = self._request('POST', url, headers, payload, idempotent=False, endpoint='create_opportunity')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        opportunity_data = response.json()
+        opportunity_data = serialization.loads(response.content)
         return opportunity_data
 
     def update_opportunity(self, pipeline_id, opportunity_id, data):
@@ -168,10 +287,10 @@ class GHL:
             'Content-Type': 'application/json'
         }
         url = self.opportunities_ep.format(pipeline_id) + '/' + str(opportunity_id)
-        payload = json.dumps(data)
-        response = requests.put(url=url, headers=headers, data=payload)
+        payload = serialization.dumps(data)
+        response = self._request('PUT', url, headers, payload, endpoint='update_opportunity')
         if response.status_code != 200:
             raise ApiError(response.status_code)
-        opportunity_data = response.json()
+        opportunity_data = serialization.loads(response.content)
         return opportunity_data
     
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Streaming backfill / reconciliation of a Vici lead or call-log export (CSV) into GHL.
+
+The export is read in chunks of --chunk-rows rows with constant memory. Each chunk is
+grouped by location and pushed through the same pipeline as the batch endpoint
+(process_batch: cached config and metadata, contact index, write buffer, bounded
+concurrency). Only the last row per phone in a chunk is applied, and the write buffer
+diffs it against the known contact state, so unchanged contacts cost one lookup at most
+and no update. Call notes are only added with --notes.
+
+Progress is checkpointed after every chunk (byte offset into the file), so an interrupted
+run resumes where it stopped; failed rows are appended to a JSON-lines failures file.
+
+Run from the directory that contains the package, e.g.
+    python -m cf_vici_ghl_handler_v2.backfill export.csv --location abc123 --concurrency 8
+"""
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+from . import main
+from . import batch
+from .contact_index import normalize_phone
+
+BACKFILL_CHUNK_ROWS = int(os.environ.get('BACKFILL_CHUNK_ROWS', '2000'))
+
+# Vici export column -> vici_to_ghl parameter. Columns not listed keep their name, so
+# exports that already use the webhook parameter names work as they are.
+VICI_EXPORT_COLUMNS = {
+    'lead_id': 'leadID',
+    'status': 'disposition',
+    'list_id': 'listID',
+    'campaign_id': 'campaignID',
+    'phone_number': 'dialedNumber',
+    'first_name': 'firstName',
+    'last_name': 'lastName',
+    'postal_code': 'zip',
+    'country_code': 'country',
+    'alt_phone': 'altNumber',
+    'comments': 'callNote',
+    'user': 'agentAssigned',
+    'term_reason': 'termReason',
+}
+
+
+class LineReader:
+    """
+    Iterates the decoded lines of a file opened in binary mode and tracks the byte offset
+    after the last line handed out. csv.reader pulls lines one record at a time, so after
+    each row the offset is a row boundary that a checkpoint can seek back to.
+    """
+
+    def __init__(self, f, encoding='utf-8-sig') -> None:
+        self.f = f
+        self.encoding = encoding
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.offset = offset
+
+
+def read_chunks(path, offset=0, chunk_rows=BACKFILL_CHUNK_ROWS):
+    """
+    Yields (rows, end offset) for the export, starting at a row boundary `offset`
+    (0 for the beginning). Rows are dicts keyed by the header columns.
+    """
+    with open(path, 'rb') as f:
+        lines = LineReader(f)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            return
+        if offset > lines.offset:
+            lines.seek(offset)
+        chunk = []
+        for values in csv.reader(lines):
+            if not any(values):
+                continue
+            chunk.append(dict(zip(header, values)))
+            if len(chunk) >= chunk_rows:
+                yield chunk, lines.offset
+                chunk = []
+        if chunk:
+            yield chunk, lines.offset
+
+
+def to_params(row, location=None):
+    """
+    Renames export columns to vici_to_ghl parameters and fills in the default location.
+    """
+    params = {VICI_EXPORT_COLUMNS.get(column, column): value or '' for column, value in row.items() if column}
+    if location and not params.get('locationID'):
+        params['locationID'] = location
+    return params
+
+
+def latest_per_phone(rows, first_row_number):
+    """
+    Returns [(row number, params)] keeping only the last row of every (location, phone)
+    in the chunk; earlier rows would be overwritten by it anyway.
+    """
+    latest = {}
+    for row_number, params in enumerate(rows, start=first_row_number):
+        key = (params.get('locationID'), normalize_phone(params.get('dialedNumber')))
+        latest.pop(key, None)
+        latest[key] = (row_number, params)
+    return list(latest.values())
+
+
+def fresh_state(source):
+    return {"source": source, "offset": 0, "rows": 0, "applied": 0, "failed": 0, "superseded": 0}
+
+
+def load_checkpoint(checkpoint_path, source):
+    """
+    Returns the saved progress for source, or a fresh one when there is no usable checkpoint.
+    Only the progress fields are restored; updatedAt and done are bookkeeping of the saved run.
+    """
+    fresh = fresh_state(source)
+    try:
+        with open(checkpoint_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return fresh
+    if state.get('source') != source or state.get('offset', 0) > os.path.getsize(source):
+        logging.warning(f"Checkpoint {checkpoint_path} does not match {source}, starting over")
+        return fresh
+    return {field: state.get(field, value) for field, value in fresh.items()}
+
+
+def save_checkpoint(checkpoint_path, state):
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(dict(state, updatedAt=time.time()), f)
+    os.replace(temp_path, checkpoint_path)
+
+
+def run(path, location=None, checkpoint_path=None, failures_path=None, chunk_rows=BACKFILL_CHUNK_ROWS,
+        concurrency=batch.BATCH_CONCURRENCY, notes=False, restart=False, progress=print):
+    """
+    Runs (or resumes) a backfill of the export at path and returns the final progress dict.
+    """
+    source = os.path.abspath(path)
+    checkpoint_path = checkpoint_path or source + '.checkpoint'
+    failures_path = failures_path or source + '.failures.jsonl'
+    state = load_checkpoint(checkpoint_path, source) if not restart else None
+    if state is None or state['offset'] == 0:
+        state = fresh_state(source)
+        open(failures_path, 'w').close()
+    elif progress:
+        progress(f"resuming at row {state['rows']} (byte {state['offset']})")
+
+    started = time.monotonic()
+    with open(failures_path, 'a') as failures:
+        for chunk, end_offset in read_chunks(source, state['offset'], chunk_rows):
+            rows = [to_params(row, location) for row in chunk]
+            numbered = (list(enumerate(rows, start=state['rows'] + 1)) if notes
+                        else latest_per_phone(rows, state['rows'] + 1))
+            kept = [params for _, params in numbered]
+            for result in main.process_batch(kept, concurrency, add_note=notes):
+                if result['status'] == 200:
+                    state['applied'] += 1
+                else:
+                    state['failed'] += 1
+                    failures.write(json.dumps(dict(result, row=numbered[result['row']][0])) + "\n")
+            failures.flush()
+            state['superseded'] += len(rows) - len(kept)
+            state['rows'] += len(rows)
+            state['offset'] = end_offset
+            save_checkpoint(checkpoint_path, state)
+            if progress:
+                elapsed = time.monotonic() - started
+                progress(f"rows {state['rows']}  applied {state['applied']}  failed {state['failed']}  "
+                         f"superseded {state['superseded']}  ({elapsed:.0f}s)")
+    state['done'] = True
+    save_checkpoint(checkpoint_path, state)
+    return state
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help="Vici export (CSV with a header row)")
+    parser.add_argument('--location', default=None, help="GHL location id for rows without a locationID column")
+    parser.add_argument('--checkpoint', default=None, help="checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument('--failures', default=None, help="failed rows, JSON lines (default: <path>.failures.jsonl)")
+    parser.add_argument('--chunk-rows', type=int, default=BACKFILL_CHUNK_ROWS)
+    parser.add_argument('--concurrency', type=int, default=batch.BATCH_CONCURRENCY)
+    parser.add_argument('--notes', action='store_true', help="also add a call note for every row")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and start from the top")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    state = run(args.path, location=args.location, checkpoint_path=args.checkpoint, failures_path=args.failures,
+                chunk_rows=args.chunk_rows, concurrency=args.concurrency, notes=args.notes, restart=args.restart)
+    print(f"done: {state['rows']} rows, {state['applied']} applied, {state['failed']} failed, "
+          f"{state['superseded']} superseded by a later row")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,57 @@
+import os
+import io
+import csv
+import json
+
+# Upper bounds for one batch request. Larger replays should be split by the caller.
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', '50000'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+
+
+def parse_rows(body, content_type=None):
+    """
+    Parses a batch body into a list of lead parameter dicts (same keys as the
+    vici_to_ghl query string). JSON-lines and CSV with a header row are supported;
+    the format is taken from the content type, or sniffed from the first character.
+    """
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        is_csv = True
+    elif 'json' in content_type:
+        is_csv = False
+    else:
+        is_csv = not body.lstrip().startswith('{')
+
+    if is_csv:
+        rows = list(csv.DictReader(io.StringIO(body)))
+    else:
+        rows = []
+        for line_number, line in enumerate(body.splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise ValueError(f"Invalid JSON on line {line_number}")
+            if not isinstance(row, dict):
+                raise ValueError(f"Expected a JSON object on line {line_number}")
+            rows.append(row)
+
+    if len(rows) > BATCH_MAX_ROWS:
+        raise ValueError(f"Batch has {len(rows)} rows, the limit is {BATCH_MAX_ROWS}")
+    # Vici values are strings in the query string, keep them that way.
+    return [{k: '' if v is None else str(v) for k, v in row.items() if k} for row in rows]
+
+
+def group_rows(rows, location_key='locationID', phone_key='dialedNumber'):
+    """
+    Groups (row number, row) pairs by location and, inside each location, by phone number.
+    Rows for the same phone stay in their original order so they are applied sequentially.
+    """
+    groups = {}
+    for row_number, row in enumerate(rows):
+        location = row.get(location_key) or ''
+        phone = (row.get(phone_key) or '').strip()
+        groups.setdefault(location, {}).setdefault(phone, []).append((row_number, row))
+    return groups
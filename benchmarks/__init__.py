@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks import main.py; keep its background Firestore warm-up out of the timings.
+os.environ.setdefault('STARTUP_WARMUP', '0')
@@ -0,0 +1,45 @@
+"""
+Micro-benchmark for the disposition and tag matchers.
+
+Lists the statuses whose label changed from the previous first-match translation and
+times the previous implementation against the compiled matchers, over the statuses in
+disposition_tables.py (tests/test_dispositions.py checks the matchers against them).
+
+Run from the directory that contains the package:
+    python -m <package>.benchmarks.bench_dispositions
+"""
+import timeit
+from ..main import set_disposition_translated, set_tags
+from .disposition_tables import VICI_STATUSES, TAG_MAPPING, legacy_translate, legacy_tags
+
+ITERATIONS = 2000
+
+
+def changed_statuses():
+    """
+    Statuses whose translation differs from the previous implementation.
+    """
+    return [(status, legacy_translate(status), set_disposition_translated(status))
+            for status in VICI_STATUSES if legacy_translate(status) != set_disposition_translated(status)]
+
+
+def main():
+    print("statuses translated differently than before (previous -> now):")
+    for status, before, now in changed_statuses():
+        print(f"  {status:<8} {before or '-':<24} -> {now or '-'}")
+
+    overrides = {"SALE": "Sale"}
+    cases = (
+        ("translate legacy", lambda: [legacy_translate(s) for s in VICI_STATUSES]),
+        ("translate trie", lambda: [set_disposition_translated(s) for s in VICI_STATUSES]),
+        ("translate trie+override", lambda: [set_disposition_translated(s, overrides) for s in VICI_STATUSES]),
+        ("tags legacy", lambda: [legacy_tags(s, TAG_MAPPING) for s in VICI_STATUSES]),
+        ("tags index", lambda: [set_tags(s, TAG_MAPPING) for s in VICI_STATUSES]),
+    )
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=ITERATIONS, repeat=5))
+        print(f"{name:>24}: {best / ITERATIONS / len(VICI_STATUSES) * 1e9:8.1f} ns/disposition")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Micro-benchmark of the per-request CPU spent turning Vici query parameters into the
+GHL customField payload: the previous hand-unrolled extraction + regex clean-up + scan
+over every GHL field definition, against the compiled mapping used by set_custom_fields.
+
+Run from the directory that contains the package:
+    python -m <package>.benchmarks.bench_mapping
+"""
+import re
+import timeit
+from ..main import set_custom_fields, set_disposition_translated
+from ..mapping import CUSTOM_FIELD_SCHEMA, DEFAULT_MAPPING
+from ..metadata import LocationMetadata
+
+ITERATIONS = 20000
+
+
+def legacy_custom_fields(params, custom_fields):
+    """
+    The extraction, placeholder clean-up and field resolution as they were before the mapping table.
+    """
+    first_name = params.get('firstName')
+    last_name = params.get('lastName')
+    dialed_number = params.get('dialedNumber')
+    disposition = params.get('disposition')
+    campaign_id = params.get('campaignID')
+    term_reason = params.get('termReason')
+    call_note = params.get('callNote')
+    email = params.get('email')
+    list_id = params.get('listID')
+    lead_id = params.get('leadID', '0')
+    location_path = params.get('locationID')
+    city = params.get('city')
+    state = params.get('state')
+    zip_code = params.get('zip')
+    country = params.get('country')
+    lead_type = params.get('leadType', '')
+    agent_assigned = params.get('agentAssigned', '')
+    alt_number = params.get('altNumber', '')
+    home_value = params.get('homeValue', '')
+    create_date = params.get('createDate', '')
+    equity = params.get('equity', '')
+    crm_name = params.get('crmName', '')
+    contact_link = params.get('contactLink', '')
+    build_date = params.get('buildDate', '')
+    listing_agent = params.get('listingAgent', '')
+    baths = params.get('baths', '')
+    buyer_agent = params.get('buyerAgent', '')
+    beds = params.get('beds', '')
+    lot_size = params.get('lotSize', '')
+    sqft = params.get('sqft', '')
+    build=params.get('build', '')
+    home_value = params.get('homeValue', '')
+    sq_ft = params.get('sqFt', '')
+    county = params.get('county', '')
+    zestimate = params.get('zestimate', '')
+    last_submission = params.get('lastSubmission', '')
+    tag = params.get('tag', '')
+    lead_score = params.get('leadScore', '')
+    last_submission_date = params.get('lastSubmissionDate', '')
+    estimated_price = params.get('estimatedPrice', '')
+    last_number_dialed = params.get('lastNumberDialed', '')
+    days_on_market = params.get('daysOnMarket', '')
+    final_question = params.get('finalQuestion', '')
+    alt_number = params.get('altNumber', '')
+    listing_status = params.get('listingStatus', '')
+    team_member = params.get('teamMember', '')
+    bathrooms = params.get('bathrooms', '')
+    motivation = params.get('motivation', '')
+    secondary_number = params.get('secondaryNumber', '')
+    homeowner= params.get('homeowner', '')
+    home_to_sell_or_buy = params.get('homeToSellOrBuy', '')
+    areas_of_interest = params.get('areasOfInterest', '')
+    pending_repairs = params.get('pendingRepairs', '')
+    non_negotiables = params.get('nonNegotiables', '')
+    timeframe = params.get('timeframe', '')
+    bedrooms = params.get('bedrooms', '')
+    lender = params.get('lender', '')
+    recent_upgrades = params.get('recentUpgrades', '')
+
+
+    disposition_translated = set_disposition_translated(disposition)
+    custom_fields_values = {
+        "disposition": disposition_translated,
+        "term_reason": term_reason,
+        "list_id": list_id,
+        "lead_id": lead_id,
+        "campaign": campaign_id,
+        "lead_type": lead_type,
+        "agent_assigned": agent_assigned,
+        "alt_number": alt_number,
+        "home_value": home_value,
+        "create_date": create_date,
+        "equity": equity,
+        "crm_name": crm_name,
+        "contact_link": contact_link,
+        "build_date": build_date,
+        "listing_agent": listing_agent,
+        "baths": baths,
+        "buyer_agent": buyer_agent,
+        "beds": beds,
+        "lot_size": lot_size,
+        "sqft": sqft,
+        "build": build,
+        "home_value": home_value,
+        "sq_ft": sq_ft,
+        "county": county,
+        "zestimate": zestimate,
+        "last_submission": last_submission,
+        "tag": tag,
+        "lead_score": lead_score,
+        "last_submission_date": last_submission_date,
+        "estimated_price": estimated_price,
+        "last_number_dialed": last_number_dialed,
+        "days_on_market": days_on_market,
+        "final_question": final_question,
+        "alt_number": alt_number,
+        "listing_status": listing_status,
+        "team_member": team_member,
+        "bathrooms": bathrooms,
+        "motivation": motivation,
+        "secondary_number": secondary_number,
+        "homeowner": homeowner,
+        "home_to_sell_or_buy": home_to_sell_or_buy,
+        "areas_of_interest": areas_of_interest,
+        "pending_repairs": pending_repairs,
+        "non_negotiables": non_negotiables,
+        "timeframe": timeframe,
+        "bedrooms": bedrooms,
+        "lender": lender,
+        "recent_upgrades": recent_upgrades,
+        "notes": call_note,
+    }
+
+
+    cleaned = {}
+    pattern = re.compile(r'^--A--.*--B--$')
+    for k, v in custom_fields_values.items():
+        if isinstance(v, str) and pattern.match(v):
+            cleaned[k] = ""
+        else:
+            cleaned[k] = v
+
+    result = {}
+    for field in custom_fields:
+        try:
+            custom_field = field['fieldKey'].split(".")[1]
+        except IndexError:
+            continue
+        if custom_field in cleaned and cleaned[custom_field]:
+            if custom_field == "disposition":
+                current_disposition = field.get('currentValue')
+                if current_disposition and cleaned[custom_field] == current_disposition.replace(".", ""):
+                    result[field['id']] = current_disposition + "."
+                else:
+                    result[field['id']] = cleaned[custom_field]
+            else:
+                result[field['id']] = cleaned[custom_field]
+    return result
+
+
+def sample_request():
+    """
+    A realistic dispatch: every mapped parameter present, a third of them left as
+    unfilled template placeholders, and a GHL location with one field per key.
+    """
+    params = {
+        'firstName': 'Jane', 'lastName': 'Doe', 'dialedNumber': '5551234567', 'locationID': 'loc1',
+        'disposition': 'CALLBK', 'city': 'Austin', 'state': 'TX', 'zip': '73301', 'country': 'US',
+    }
+    for i, (param, key, _) in enumerate(CUSTOM_FIELD_SCHEMA):
+        params[param] = f'--A--{key}--B--' if i % 3 == 0 else f'value {i}'
+    custom_fields = [{'id': f'field{i}', 'fieldKey': f'contact.{key}'}
+                     for i, (_, key, _) in enumerate(CUSTOM_FIELD_SCHEMA)]
+    custom_fields.append({'id': 'field_disposition', 'fieldKey': 'contact.disposition'})
+    custom_fields += [{'id': f'other{i}', 'fieldKey': f'contact.unrelated_{i}'} for i in range(20)]
+    return params, custom_fields
+
+
+def main():
+    params, custom_fields = sample_request()
+    metadata = LocationMetadata(custom_fields, [])
+
+    def compiled():
+        disposition_translated = set_disposition_translated(params['disposition'])
+        return set_custom_fields(params, metadata.fields_by_key, DEFAULT_MAPPING, disposition_translated)
+
+    assert legacy_custom_fields(params, custom_fields) == compiled()
+
+    for name, fn in (("legacy", lambda: legacy_custom_fields(params, custom_fields)), ("compiled", compiled)):
+        best = min(timeit.repeat(fn, number=ITERATIONS, repeat=5))
+        print(f"{name:>8}: {best / ITERATIONS * 1e6:8.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Payload size and CPU benchmark for the GHL serialization layer.
+
+Builds contact payloads the way vici_to_ghl does for a location with 58 mapped custom
+fields (the schema plus fieldMapping additions), for a fully filled lead and for a sparse
+one (no email or country, unfilled template values). The previous payload and encoding
+(every key, None included, json.dumps) is compared with build_contact_data and
+serialization.dumps, and the
+previous response handling (response.json() once per access) with a single
+serialization.loads, on a custom fields response and a contact lookup response.
+Both JSON backends are measured when orjson is installed.
+
+Run from the directory that contains the package:
+    python -m <package>.benchmarks.bench_serialization
+"""
+import json
+import timeit
+import requests
+from .. import serialization
+from ..main import extract_lead, build_contact_data, set_custom_fields, set_disposition_translated, set_tags
+from ..mapping import CUSTOM_FIELD_SCHEMA, mapping_for
+from ..metadata import LocationMetadata
+
+ITERATIONS = 5000
+EXTRA_FIELDS = 12
+
+CONFIG = {"fieldMapping": {f"extra{i}": f"extra_field_{i}" for i in range(EXTRA_FIELDS)}}
+
+
+def location_fields():
+    """
+    GHL custom field definitions as get_custom_fields returns them: one per mapped key,
+    the disposition field, and fields the integration does not write.
+    """
+    keys = [key for _, key, _ in CUSTOM_FIELD_SCHEMA] + [f"extra_field_{i}" for i in range(EXTRA_FIELDS)]
+    fields = [{"id": "field_disposition", "name": "Disposition", "fieldKey": "contact.disposition",
+               "dataType": "TEXT", "position": 0}]
+    fields += [{"id": f"f{i:02d}aZ8kQm3xL0pV7c", "name": key.replace('_', ' ').title(), "fieldKey": f"contact.{key}",
+                "dataType": "TEXT", "position": i + 1, "placeholder": ""} for i, key in enumerate(keys)]
+    fields += [{"id": f"u{i:02d}bY7jRn2wK9oU6d", "name": f"Unrelated {i}", "fieldKey": f"contact.unrelated_{i}",
+                "dataType": "LARGE_TEXT", "position": 100 + i, "placeholder": ""} for i in range(20)]
+    return fields
+
+
+def sample_params(sparse=False):
+    params = {
+        'firstName': 'Jane', 'lastName': 'Doe', 'dialedNumber': '(555) 123-4567', 'locationID': 'loc1',
+        'disposition': 'CALLBK', 'city': 'Austin', 'state': 'TX', 'zip': '73301', 'listID': '1001',
+        'termReason': 'CALLER', 'callNote': 'Asked for a call back next week about the listing.',
+    }
+    if not sparse:
+        params.update(email='jane.doe@example.com', country='US')
+    mapped = [param for param, _, _ in CUSTOM_FIELD_SCHEMA] + [f"extra{i}" for i in range(EXTRA_FIELDS)]
+    for i, param in enumerate(mapped):
+        if param in params:
+            continue
+        if sparse and i % 3 == 0:
+            params[param] = f'--A--{param}--B--'
+        elif sparse and i % 3 == 1:
+            params[param] = ''
+        else:
+            params[param] = f'{param} value {i}'
+    return params
+
+
+def legacy_payload(lead, config, metadata):
+    """
+    The contact payload as it was built before: every key, and address1 from all parts.
+    """
+    disposition_translated = set_disposition_translated(lead['disposition'], config.get('dispositionMapping'))
+    return {
+        "firstName": lead['first_name'],
+        "lastName": lead['last_name'],
+        "email": lead['email'],
+        "phone": lead['phone'],
+        "city": lead['city'],
+        "state": lead['state'],
+        "postalCode": lead['zip_code'],
+        "address1": f"{lead['city']}, {lead['state']} {lead['zip_code']}, {lead['country']}",
+        "customField": set_custom_fields(lead['params'], metadata.fields_by_key, mapping_for(config),
+                                         disposition_translated),
+        "tags": set_tags(lead['disposition'], config.get('dispositionTagMapping')),
+    }
+
+
+def without_empty(data):
+    return {key: value for key, value in data.items() if value not in (None, '', [], {})}
+
+
+def response_for(body):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(body).encode('utf-8')
+    return response
+
+
+def legacy_custom_fields(response):
+    custom_fields_data = []
+    if 'customFields' in response.json():
+        custom_fields_data = response.json()
+    if len(custom_fields_data) == 0:
+        return None
+    return custom_fields_data['customFields']
+
+
+def legacy_lookup(response):
+    contact_data = []
+    if 'contacts' in response.json():
+        contact_data = response.json()['contacts']
+    if len(contact_data) == 0:
+        return None
+    return contact_data[0]
+
+
+def parsed_custom_fields(response):
+    body = serialization.loads(response.content)
+    return body['customFields'] if body.get('customFields') else None
+
+
+def parsed_lookup(response):
+    body = serialization.loads(response.content)
+    return body['contacts'][0] if body.get('contacts') else None
+
+
+def per_call(fn):
+    return min(timeit.repeat(fn, number=ITERATIONS, repeat=7)) / ITERATIONS * 1e6
+
+
+def main():
+    fields = location_fields()
+    metadata = LocationMetadata(fields, [])
+    payloads = {}
+    for name, sparse in (("full lead", False), ("sparse lead", True)):
+        lead = extract_lead(sample_params(sparse))
+        payloads[name] = (lead, legacy_payload(lead, CONFIG, metadata), build_contact_data(lead, CONFIG, metadata))
+
+    full = payloads["full lead"][2]
+    contact = dict(full, id="contact1", customField=[{"id": k, "value": v} for k, v in full["customField"].items()])
+    responses = {
+        "custom fields": (response_for({"customFields": fields}), legacy_custom_fields, parsed_custom_fields),
+        "contact lookup": (response_for({"contacts": [contact]}), legacy_lookup, parsed_lookup),
+    }
+
+    backends = ['json'] + (['orjson'] if serialization.configure('orjson') == 'orjson' else [])
+    print(f"backends: {', '.join(backends)}" + ("" if 'orjson' in backends else " (orjson not installed)"))
+
+    for name, (lead, legacy, data) in payloads.items():
+        encoded = serialization.dumps(data)
+        # Same content as before, minus the empty values.
+        expected = without_empty(dict(legacy, address1=data["address1"]))
+        assert json.loads(encoded) == expected, name
+        legacy_bytes = json.dumps(legacy).encode('utf-8')
+        print(f"\n{name}: {len(data['customField'])} custom fields, "
+              f"{len(legacy_bytes)} -> {len(encoded)} bytes ({1 - len(encoded) / len(legacy_bytes):.0%} smaller)")
+        print(f"  address1 {legacy['address1']!r} -> {data['address1']!r}")
+        print(f"  {'encode legacy':>22}: {per_call(lambda: json.dumps(legacy).encode('utf-8')):7.1f} us")
+        for backend in backends:
+            serialization.configure(backend)
+            print(f"  {'encode ' + backend:>22}: {per_call(lambda: serialization.dumps(data)):7.1f} us")
+        print(f"  {'build+encode legacy':>22}: "
+              f"{per_call(lambda: json.dumps(legacy_payload(lead, CONFIG, metadata)).encode('utf-8')):7.1f} us")
+        for backend in backends:
+            serialization.configure(backend)
+            print(f"  {'build+encode ' + backend:>22}: "
+                  f"{per_call(lambda: serialization.dumps(build_contact_data(lead, CONFIG, metadata))):7.1f} us")
+
+    for name, (response, legacy, parsed) in responses.items():
+        assert legacy(response) == parsed(response), name
+        print(f"\n{name} response: {len(response.content)} bytes")
+        print(f"  {'parse legacy':>22}: {per_call(lambda: legacy(response)):7.1f} us")
+        for backend in backends:
+            serialization.configure(backend)
+            print(f"  {'parse once ' + backend:>22}: {per_call(lambda: parsed(response)):7.1f} us")
+    serialization.configure(serialization.JSON_BACKEND)
+
+
+if __name__ == '__main__':
+    main()
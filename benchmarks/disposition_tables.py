@@ -0,0 +1,52 @@
+"""
+Status tables and the previous (linear scan) disposition and tag matchers, shared by
+tests/test_dispositions.py and benchmarks/bench_dispositions.py.
+"""
+from ..dispositions import DEFAULT_DISPOSITIONS
+
+# Vicidial system statuses, followed by the custom statuses configured in our campaigns.
+VICI_STATUSES = (
+    'A', 'AA', 'AB', 'ADC', 'ADCT', 'AFAX', 'AFTHRS', 'AL', 'AM', 'B', 'CALLBK', 'CBHOLD',
+    'CPDATB', 'CPDB', 'CPDERR', 'CPDINV', 'CPDNA', 'CPDREJ', 'CPDSI', 'CPDSNC', 'CPDSR',
+    'CPDSUA', 'CPDSUV', 'CPDUK', 'DC', 'DEC', 'DispO', 'DNC', 'DNCC', 'DNCL', 'DROP', 'ERI',
+    'INCALL', 'IQNANQ', 'IVRXFR', 'LRERR', 'LSMERG', 'MAXCAL', 'MLINAT', 'N', 'NA', 'NANQUE',
+    'NEW', 'NI', 'NP', 'PDROP', 'PM', 'PU', 'QCFAIL', 'QUEUE', 'QVMAIL', 'RQXFER', 'SALE',
+    'SVYCLM', 'SVYEXT', 'SVYHU', 'SVYREC', 'SVYVM', 'TIMEOT', 'WAITTO', 'XDROP', 'XFER',
+    'CBL', 'Follow', 'NAU', 'NPRSN', 'Nurtre', 'PHNAPT', 'WN',
+)
+
+TAG_MAPPING = {
+    "Hot Lead": ["PHNAPT", "NPRSN", "SALE"],
+    "Callback": ["CALLBK", "CBL", "CBHOLD"],
+    "Dead": ["DNC", "DNCL", "DC", "WN"],
+    "Duplicate": ["SALE"],
+}
+
+
+def legacy_translate(disposition):
+    """
+    set_disposition_translated as it was: a dict built per call, first startswith match wins.
+    """
+    dispositions_mapping = dict(DEFAULT_DISPOSITIONS)
+    result = ""
+    if disposition:
+        for key, value in dispositions_mapping.items():
+            if disposition.upper().startswith(key.upper()):
+                result = value
+                break
+    return result
+
+
+def legacy_tags(disposition, disposition_tag_mapping):
+    """
+    set_tags as it was: a linear scan where the first tag listing the status wins.
+    """
+    result = []
+    if disposition:
+        for tag, values in disposition_tag_mapping.items():
+            if disposition in values:
+                result.append(tag)
+                break
+    if not result:
+        result.append("New Lead")
+    return result
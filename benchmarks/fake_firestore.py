@@ -0,0 +1,129 @@
+"""
+In-memory stand-in for the parts of google.cloud.firestore.Client used by this function
+(document get/create/set/update/delete and snapshot listeners), for offline load tests.
+Install it with config_cache.set_client(FakeFirestore(...)).
+"""
+import copy
+import time
+import random
+import threading
+from google.api_core.exceptions import AlreadyExists
+
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data[field]
+
+
+class FakeDocument:
+
+    def __init__(self, client, path) -> None:
+        self.client = client
+        self.path = path
+        self.id = path.split('/')[-1]
+
+    def get(self, timeout=None, transaction=None):
+        self.client._delay()
+        with self.client.lock:
+            self.client.reads += 1
+            return FakeSnapshot(self, copy.deepcopy(self.client.documents.get(self.path)))
+
+    def set(self, data, merge=False, timeout=None):
+        with self.client.lock:
+            if merge and self.path in self.client.documents:
+                self.client.documents[self.path].update(copy.deepcopy(data))
+            else:
+                self.client.documents[self.path] = copy.deepcopy(data)
+        self.client._notify(self.path)
+
+    def create(self, data, timeout=None):
+        with self.client.lock:
+            if self.path in self.client.documents:
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            self.client.documents[self.path] = copy.deepcopy(data)
+        self.client._notify(self.path)
+
+    def update(self, data, timeout=None):
+        with self.client.lock:
+            self.client.documents[self.path].update(copy.deepcopy(data))
+        self.client._notify(self.path)
+
+    def delete(self, timeout=None):
+        with self.client.lock:
+            self.client.documents.pop(self.path, None)
+        self.client._notify(self.path)
+
+    def on_snapshot(self, callback):
+        return self.client._listen(self, callback)
+
+
+class FakeCollection:
+
+    def __init__(self, client, name) -> None:
+        self.client = client
+        self.name = name
+
+    def document(self, document_id):
+        return FakeDocument(self.client, f"{self.name}/{document_id}")
+
+
+class FakeWatch:
+
+    def __init__(self, client, path, callback) -> None:
+        self.client = client
+        self.path = path
+        self.callback = callback
+
+    def unsubscribe(self):
+        with self.client.lock:
+            listeners = self.client.listeners.get(self.path, [])
+            if self in listeners:
+                listeners.remove(self)
+
+
+class FakeFirestore:
+    """
+    documents maps full document paths (e.g. "configurations/loc1") to dicts.
+    latency_ms is a (min, max) range added to every read.
+    """
+
+    def __init__(self, documents=None, latency_ms=(0, 0)) -> None:
+        self.documents = copy.deepcopy(documents or {})
+        self.latency_ms = latency_ms
+        self.listeners = {}
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def _delay(self):
+        low, high = self.latency_ms
+        if high:
+            time.sleep(random.uniform(low, high) / 1000)
+
+    def _listen(self, document, callback):
+        watch = FakeWatch(self, document.path, callback)
+        with self.lock:
+            self.listeners.setdefault(document.path, []).append(watch)
+        callback([document.get()], [], time.time())
+        return watch
+
+    def _notify(self, path):
+        with self.lock:
+            listeners = list(self.listeners.get(path, []))
+        for watch in listeners:
+            watch.callback([FakeDocument(self, path).get()], [], time.time())
@@ -0,0 +1,235 @@
+"""
+In-process stand-in for the GHL v1 REST endpoints used by apps.GHL, for offline load tests.
+Latency, error rate and rate limiting (429 with X-RateLimit-* headers) are configurable.
+"""
+import json
+import time
+import random
+import itertools
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGHLState:
+    """
+    Contacts, notes and opportunities stored by the fake server, plus request counters.
+    """
+
+    def __init__(self, custom_fields, pipelines) -> None:
+        self.custom_fields = custom_fields
+        self.pipelines = pipelines
+        self.contacts = {}
+        # (API key, phone) -> contact: every location (API key) has its own contacts.
+        self.contacts_by_phone = {}
+        self.notes = Counter()
+        self.opportunities = {}
+        self.requests = Counter()
+        self.ids = itertools.count(1)
+        self.windows = {}
+        self.lock = threading.Lock()
+
+
+class FakeGHLServer:
+    """
+    Runs the fake API on 127.0.0.1 in a background thread. Use `base_url` as GHL_BASE_URL.
+    latency_ms is a (min, max) range added to every response, error_rate the share of
+    requests answered with a 503, and rate_limit the number of requests allowed per API key
+    in each rate_interval seconds before answering 429.
+    """
+
+    def __init__(self, custom_fields=None, pipelines=None, latency_ms=(0, 0), error_rate=0.0,
+                 rate_limit=None, rate_interval=10.0) -> None:
+        self.state = FakeGHLState(custom_fields or default_custom_fields(), pipelines or default_pipelines())
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_interval = rate_interval
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_PUT(self):
+                self._dispatch('PUT')
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, payload, headers = server.handle(method, self.path, self.headers.get('Authorization', ''), body)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _rate_limit_headers(self, api_key):
+        if self.rate_limit is None:
+            return None, {}
+        state = self.state
+        now = time.monotonic()
+        with state.lock:
+            window_start, count = state.windows.get(api_key, (now, 0))
+            if now - window_start >= self.rate_interval:
+                window_start, count = now, 0
+            count += 1
+            state.windows[api_key] = (window_start, count)
+        headers = {
+            'X-RateLimit-Max': str(self.rate_limit),
+            'X-RateLimit-Interval-Milliseconds': str(int(self.rate_interval * 1000)),
+            'X-RateLimit-Remaining': str(max(self.rate_limit - count, 0)),
+        }
+        if count > self.rate_limit:
+            headers['Retry-After'] = f"{max(self.rate_interval - (now - window_start), 0):.2f}"
+            return 429, headers
+        return None, headers
+
+    def handle(self, method, raw_path, authorization, body):
+        """
+        Returns (status, JSON payload, extra headers) for one request.
+        """
+        low, high = self.latency_ms
+        if high:
+            time.sleep(random.uniform(low, high) / 1000)
+        url = urlsplit(raw_path)
+        parts = [p for p in url.path.split('/') if p][1:]  # drop the "v1" prefix
+        state = self.state
+        with state.lock:
+            state.requests[(method, route_name(method, parts))] += 1
+
+        limited, headers = self._rate_limit_headers(authorization)
+        if limited:
+            return limited, {"msg": "Too many requests"}, headers
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {"msg": "Service unavailable"}, headers
+
+        account = authorization.replace('Bearer ', '')
+        with state.lock:
+            if parts[:1] == ['locations'] and method == 'GET':
+                return 200, {"id": parts[1], "apiKey": authorization.replace('Bearer ', '')}, headers
+            if parts == ['custom-fields'] and method == 'GET':
+                return 200, {"customFields": state.custom_fields}, headers
+            if parts == ['contacts', 'lookup'] and method == 'GET':
+                phone = parse_qs(url.query).get('phone', [''])[0].replace(' ', '+')
+                contact = state.contacts_by_phone.get((account, phone))
+                if contact is None:
+                    return 422, {"phone": {"message": "No contact found"}}, headers
+                return 200, {"contacts": [contact]}, headers
+            if parts == ['contacts'] and method == 'POST':
+                contact = dict(body, id=f"contact{next(state.ids)}")
+                state.contacts[contact['id']] = contact
+                state.contacts_by_phone[(account, contact.get('phone'))] = contact
+                return 200, {"contact": contact}, headers
+            if len(parts) == 2 and parts[0] == 'contacts' and method in ('GET', 'PUT'):
+                contact = state.contacts.get(parts[1])
+                if contact is None:
+                    return 404, {"msg": "Contact not found"}, headers
+                if method == 'PUT':
+                    contact.update(body)
+                return 200, {"contact": contact}, headers
+            if len(parts) == 3 and parts[0] == 'contacts' and parts[2] == 'notes' and method == 'POST':
+                if parts[1] not in state.contacts:
+                    return 404, {"msg": "Contact not found"}, headers
+                state.notes[parts[1]] += 1
+                return 200, {"id": f"note{next(state.ids)}", "body": body.get('body')}, headers
+            if parts == ['pipelines'] and method == 'GET':
+                return 200, {"pipelines": state.pipelines}, headers
+            if len(parts) >= 3 and parts[0] == 'pipelines' and parts[2] == 'opportunities':
+                pipeline_id = parts[1]
+                if method == 'GET':
+                    query = parse_qs(url.query).get('query', [''])[0]
+                    found = [o for o in state.opportunities.values()
+                             if o['account'] == account and o['pipelineId'] == pipeline_id
+                             and (not query or query in json.dumps(o))]
+                    return 200, {"opportunities": found}, headers
+                if method == 'POST':
+                    opportunity = dict(body, id=f"opportunity{next(state.ids)}", pipelineId=pipeline_id,
+                                       name=body.get('title'), account=account)
+                    contact = state.contacts.get(body.get('contactId'), {})
+                    opportunity['contact'] = {"id": body.get('contactId'), "phone": contact.get('phone'),
+                                              "email": contact.get('email')}
+                    state.opportunities[opportunity['id']] = opportunity
+                    return 200, opportunity, headers
+                if method == 'PUT' and len(parts) == 4:
+                    opportunity = state.opportunities.get(parts[3])
+                    if opportunity is None:
+                        return 404, {"msg": "Opportunity not found"}, headers
+                    opportunity.update(body)
+                    return 200, opportunity, headers
+        return 404, {"msg": f"No fake route for {method} {url.path}"}, headers
+
+
+def route_name(method, parts):
+    """
+    Collapses ids out of a path so request counters are grouped per endpoint.
+    """
+    if not parts:
+        return '/'
+    if parts[0] == 'contacts':
+        if parts[1:2] == ['lookup']:
+            return 'contacts/lookup'
+        return 'contacts/{id}/notes' if len(parts) == 3 else ('contacts' if len(parts) == 1 else 'contacts/{id}')
+    if parts[0] == 'pipelines' and len(parts) > 1:
+        return 'pipelines/{id}/opportunities' if len(parts) == 3 else 'pipelines/{id}/opportunities/{id}'
+    if parts[0] == 'locations':
+        return 'locations/{id}'
+    return parts[0]
+
+
+def default_custom_fields():
+    """
+    One custom field per mapped query parameter plus the disposition field, like a
+    fully configured location.
+    """
+    from ..mapping import CUSTOM_FIELD_SCHEMA
+    fields = [{"id": "field_disposition", "name": "Disposition", "fieldKey": "contact.disposition"}]
+    for i, (_, key, _) in enumerate(CUSTOM_FIELD_SCHEMA):
+        fields.append({"id": f"field{i}", "name": key.replace('_', ' ').title(), "fieldKey": f"contact.{key}"})
+    return fields
+
+
+def default_pipelines():
+    return [{
+        "id": "pipeline1",
+        "name": "Main Pipeline",
+        "stages": [
+            {"id": "stage_new", "name": "New Lead"},
+            {"id": "stage_contacted", "name": "Contacted"},
+            {"id": "stage_appointment", "name": "Appointment"},
+            {"id": "stage_won", "name": "Won"},
+            {"id": "stage_lost", "name": "Lost"},
+        ],
+    }]
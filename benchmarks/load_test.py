@@ -0,0 +1,176 @@
+"""
+Offline load test: replays realistic Vici dispatch query strings through an entry point,
+against benchmarks/fake_ghl.py and the in-memory Firestore stand-in, and reports
+requests/sec, latency percentiles and upstream GHL calls per webhook.
+
+Run from the directory that contains the package, e.g.
+    python -m cf_vici_ghl_handler_v2.benchmarks.load_test --requests 2000 --concurrency 16 --latency-ms 20,80
+"""
+import time
+import random
+import logging
+import argparse
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request
+from .. import main
+from .. import apps
+from .. import transport
+from .. import ratelimit
+from ..config_cache import location_configs, set_client
+from ..metadata import location_metadata
+from ..contact_index import contact_index
+from ..idempotency import idempotency
+from ..write_buffer import contact_writes
+from ..opportunity_index import opportunity_index
+from ..mapping import CUSTOM_FIELD_SCHEMA
+from .fake_ghl import FakeGHLServer
+from .fake_firestore import FakeFirestore
+
+VICI_STATUSES = ('A', 'AA', 'AB', 'ADC', 'B', 'CALLBK', 'CBL', 'DC', 'DNC', 'DROP', 'Follow', 'N',
+                 'NA', 'NAU', 'NI', 'NPRSN', 'Nurtre', 'PDROP', 'PHNAPT', 'SALE', 'WN')
+FIRST_NAMES = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis')
+
+
+def location_documents(locations):
+    documents = {}
+    for i in range(locations):
+        documents[f"configurations/location{i}"] = {
+            "locationApiKey": f"key-location{i}",
+            "userID": f"user{i}",
+            "pipelineName": "Main Pipeline",
+            "firstStageName": "New Lead",
+            "dispositionTagMapping": {"Hot Lead": ["PHNAPT", "NPRSN"], "Callback": ["CALLBK", "CBL"]},
+            "dispositionStageMapping": {"PHNAPT": "Appointment", "NPRSN": "Appointment", "SALE": "Won"},
+        }
+    return documents
+
+
+def vici_query(rng, location, phone):
+    """
+    Builds a dispatch query string like the ones Vici sends: every template parameter
+    present, with unfilled ones left as --A--name--B-- placeholders.
+    """
+    params = {
+        'firstName': rng.choice(FIRST_NAMES),
+        'lastName': rng.choice(LAST_NAMES),
+        'dialedNumber': phone,
+        'locationID': location,
+        'disposition': rng.choice(VICI_STATUSES),
+        'email': f"lead{phone}@example.com",
+        'city': 'Austin', 'state': 'TX', 'zip': '73301', 'country': 'US',
+    }
+    for param, key, _ in CUSTOM_FIELD_SCHEMA:
+        params[param] = f"--A--{key}--B--" if rng.random() < 0.4 else f"{key} {rng.randint(1, 9999)}"
+    params['leadID'] = str(rng.randint(1, 10 ** 6))
+    return urlencode(params)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(requests=1000, concurrency=16, locations=10, phones=500, latency_ms=(0, 0), error_rate=0.0,
+        rate_limit=None, client_rate_limit=None, entry='vici_to_ghl', seed=1):
+    """
+    Runs one load test and returns a dict with the measurements.
+    client_rate_limit overrides the client-side limiter (requests per location per
+    RATE_LIMIT_INTERVAL); by default the production setting applies.
+    """
+    if client_rate_limit is not None:
+        ratelimit.RATE_LIMIT_MAX = client_rate_limit
+    ratelimit.reset()
+    server = FakeGHLServer(latency_ms=latency_ms, error_rate=error_rate, rate_limit=rate_limit).start()
+    firestore = FakeFirestore(location_documents(locations))
+    apps.BASE_URL = server.base_url
+    set_client(firestore)
+    location_configs.invalidate()
+    location_metadata.invalidate()
+    contact_index.clear()
+    idempotency.clear()
+    contact_writes.clear()
+    opportunity_index.clear()
+
+    rng = random.Random(seed)
+    phone_pool = [f"555{n:07d}" for n in rng.sample(range(10 ** 7), phones)]
+    queries = [vici_query(rng, f"location{rng.randrange(locations)}", rng.choice(phone_pool)) for _ in range(requests)]
+    handler = getattr(main, entry)
+    app = Flask(__name__)
+
+    def call(query):
+        with app.test_request_context('/?' + query):
+            start = time.perf_counter()
+            result = handler(request)
+            elapsed = time.perf_counter() - start
+        status = result[1] if isinstance(result, tuple) else result.status_code
+        return elapsed, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, queries))
+    wall = time.perf_counter() - started
+    server.stop()
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    upstream = sum(server.state.requests.values())
+    return {
+        "entry": entry,
+        "requests": requests,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "wall_s": wall,
+        "rps": requests / wall,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "upstream_calls": upstream,
+        "upstream_per_webhook": upstream / requests,
+        "upstream_by_endpoint": {f"{m} {p}": n for (m, p), n in sorted(server.state.requests.items())},
+        "firestore_reads": firestore.reads,
+        "pool": transport.pool_stats(),
+    }
+
+
+def report(result):
+    print(f"entry point        {result['entry']}")
+    print(f"requests           {result['requests']} (concurrency {result['concurrency']})")
+    print(f"statuses           {result['statuses']}")
+    print(f"throughput         {result['rps']:.1f} req/s over {result['wall_s']:.2f}s")
+    print(f"latency            p50 {result['p50_ms']:.1f}ms  p95 {result['p95_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms")
+    print(f"upstream calls     {result['upstream_calls']} ({result['upstream_per_webhook']:.2f} per webhook)")
+    for endpoint, count in result['upstream_by_endpoint'].items():
+        print(f"  {endpoint:<42} {count}")
+    print(f"firestore reads    {result['firestore_reads']}")
+    pool = result['pool']
+    print(f"connections        {pool['connections']} opened, {pool['reused']} of {pool['requests']} requests reused one")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--locations', type=int, default=10)
+    parser.add_argument('--phones', type=int, default=500, help="distinct phone numbers dialed")
+    parser.add_argument('--latency-ms', default='0,0', help="min,max latency added by the fake GHL API")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of GHL requests answered with 503")
+    parser.add_argument('--rate-limit', type=int, default=None, help="GHL requests allowed per key per 10s")
+    parser.add_argument('--client-rate-limit', type=int, default=None,
+                        help="client-side limiter requests per location per 10s (default: production setting)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    low, high = (float(v) for v in args.latency_ms.split(','))
+    report(run(requests=args.requests, concurrency=args.concurrency, locations=args.locations,
+               phones=args.phones, latency_ms=(low, high), error_rate=args.error_rate,
+               rate_limit=args.rate_limit, client_rate_limit=args.client_rate_limit, seed=args.seed))
+
+
+if __name__ == '__main__':
+    main_cli()
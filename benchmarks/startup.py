@@ -0,0 +1,113 @@
+"""
+Startup benchmark: imports a module in fresh interpreters and reports the import time and
+peak RSS (median over --runs), plus the heaviest imports from `python -X importtime`.
+Use it to keep cold starts and memory down as features are added.
+
+functions_framework (and with it Flask) is imported before the timer by default, since the
+runtime has loaded it before it imports main.py; pass --baseline "" to include it.
+
+Run from the directory that contains the package, e.g.
+    python -m cf_vici_ghl_handler_v2.benchmarks.startup --runs 5
+    python -m cf_vici_ghl_handler_v2.benchmarks.startup --module google.cloud.firestore
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+CHILD = """
+import json, time, resource
+{baseline}
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+{after}
+print(json.dumps({{"import_s": elapsed, "total_s": time.perf_counter() - started,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "modules": len(__import__("sys").modules)}}))
+"""
+
+
+def package_name():
+    return __package__.rsplit('.', 1)[0]
+
+
+def measure(module, after='', baseline=''):
+    """
+    Imports `module` (then runs `after`) in a fresh interpreter that has already imported
+    `baseline`, and returns its measurements.
+    """
+    code = CHILD.format(module=module, after=after, baseline=f"import {baseline}" if baseline else '')
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def heaviest_imports(module, top=10, baseline=''):
+    """
+    Returns [(cumulative microseconds, module name)] for the slowest top-level imports.
+    """
+    code = f"import {baseline}; import {module}" if baseline else f"import {module}"
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            check=True, capture_output=True, text=True).stderr
+    if baseline:
+        stderr = stderr[stderr.index(f'| {baseline}\n') + 1:]
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # The measured module and the modules it imports directly.
+        depth = len(name) - len(name.lstrip())
+        if depth <= 3:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def run(module, runs=5, after='', baseline=''):
+    results = [measure(module, after, baseline) for _ in range(runs)]
+    return {
+        "module": module,
+        "baseline": baseline,
+        "warm": bool(after),
+        "runs": runs,
+        "import_ms": statistics.median(r["import_s"] for r in results) * 1000,
+        "total_ms": statistics.median(r["total_s"] for r in results) * 1000,
+        "peak_rss_mb": statistics.median(r["peak_rss_mb"] for r in results),
+        "modules": statistics.median(r["modules"] for r in results),
+    }
+
+
+def report(result, heaviest=()):
+    print(f"module             {result['module']} ({result['runs']} runs, median)")
+    if result['baseline']:
+        print(f"already imported   {result['baseline']}")
+    print(f"import time        {result['import_ms']:.1f}ms")
+    if result['warm']:
+        print(f"import + warm-up   {result['total_ms']:.1f}ms")
+    print(f"peak RSS           {result['peak_rss_mb']:.1f}MB")
+    print(f"modules loaded     {result['modules']:.0f}")
+    if heaviest:
+        print("heaviest imports (cumulative)")
+        for microseconds, name in heaviest:
+            print(f"  {name:<50} {microseconds / 1000:.1f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default=None, help="module to import (default: the package's main)")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', default='functions_framework',
+                        help="module imported before timing starts (default: functions_framework)")
+    parser.add_argument('--top', type=int, default=10, help="number of heaviest imports listed")
+    parser.add_argument('--warm', action='store_true',
+                        help="also wait for the background warm-up started at import")
+    args = parser.parse_args()
+    module = args.module or f"{package_name()}.main"
+    after = f"import {package_name()}.warmup as w; w.wait()" if args.warm else ''
+    heaviest = heaviest_imports(module, args.top, args.baseline) if args.top else ()
+    report(run(module, args.runs, after, args.baseline), heaviest)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,191 @@
+import os
+import sys
+import threading
+import logging
+from cachetools import TTLCache
+from . import tracing
+
+# Location configuration changes rarely, so it is cached in memory per worker.
+# Missing documents are cached for a shorter time so a newly added location shows up quickly.
+CONFIG_CACHE_SIZE = int(os.environ.get('CONFIG_CACHE_SIZE', '256'))
+CONFIG_CACHE_TTL = float(os.environ.get('CONFIG_CACHE_TTL', '300'))
+CONFIG_NEGATIVE_TTL = float(os.environ.get('CONFIG_NEGATIVE_TTL', '30'))
+CONFIG_LISTENERS = os.environ.get('CONFIG_LISTENERS', '0') == '1'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide Firestore client.
+    Building a client sets up a gRPC channel, so it is done once per worker. The
+    google.cloud.firestore import (grpc, protobuf) is deferred to the first call as well.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud import firestore
+                _client = firestore.Client()
+    return _client
+
+
+def is_not_found(error):
+    """
+    True when error is a google.api_core NotFound. The check does not import
+    google.api_core: if it was never loaded, no Google API call can have raised.
+    """
+    exceptions = sys.modules.get('google.api_core.exceptions')
+    return exceptions is not None and isinstance(error, exceptions.NotFound)
+
+
+def set_client(client):
+    """
+    Replaces the process-wide Firestore client, e.g. with an in-memory stand-in for local runs.
+    """
+    global _client
+    with _client_lock:
+        _client = client
+
+
+class _EvictingTTLCache(TTLCache):
+    """
+    TTLCache that reports the keys it drops by itself, when full or when they expire.
+    """
+
+    def __init__(self, maxsize, ttl, on_evict) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._on_evict(key)
+        return key, value
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, _ in expired:
+            self._on_evict(key)
+        return expired
+
+
+class ConfigCache:
+    """
+    Bounded TTL cache of location configuration documents keyed by document path.
+    When listen is enabled, a Firestore snapshot listener is attached to every cached
+    document so edits replace the cached entry without waiting for the TTL. The listener
+    is detached when its entry is evicted or expires.
+    """
+
+    def __init__(self, maxsize=CONFIG_CACHE_SIZE, ttl=CONFIG_CACHE_TTL,
+                 negative_ttl=CONFIG_NEGATIVE_TTL, listen=CONFIG_LISTENERS, client_factory=get_client) -> None:
+        self.listen = listen
+        self.client_factory = client_factory
+        # Paths dropped by the caches; their listeners are detached outside the lock.
+        self._evicted = []
+        self._found = _EvictingTTLCache(maxsize, ttl, self._evicted.append)
+        self._missing = _EvictingTTLCache(maxsize, negative_ttl, self._evicted.append)
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, timeout=10):
+        """
+        Returns the configuration dict stored at path, or None when the document does not exist.
+        """
+        with self._lock:
+            if path in self._found:
+                return self._found[path]
+            if path in self._missing:
+                return None
+
+        try:
+            return self._load(path, timeout)
+        finally:
+            self._detach_evicted()
+
+    def _load(self, path, timeout):
+        with tracing.span("firestore.get", path=path, endpoint="configuration") as trace:
+            snapshot = self.client_factory().document(path).get(timeout=timeout)
+            trace.set(status=200 if snapshot.exists else 404)
+        with self._lock:
+            if not snapshot.exists:
+                self._missing[path] = True
+                return None
+            config = snapshot.to_dict()
+            self._found[path] = config
+        if self.listen:
+            self._watch(path)
+        return config
+
+    def invalidate(self, path=None):
+        """
+        Drops one cached path, or every entry and listener when path is None.
+        """
+        with self._lock:
+            if path is None:
+                self._found.clear()
+                self._missing.clear()
+                self._evicted.clear()
+                watches, self._watches = list(self._watches.values()), {}
+            else:
+                self._found.pop(path, None)
+                self._missing.pop(path, None)
+                watches = [self._watches.pop(path, None)]
+        for watch in watches:
+            if watch is not None:
+                watch.unsubscribe()
+
+    def _detach_evicted(self):
+        """
+        Unsubscribes the listeners of paths that are no longer cached.
+        """
+        with self._lock:
+            self._found.expire()
+            self._missing.expire()
+            evicted = list(self._evicted)
+            self._evicted.clear()
+            watches = [self._watches.pop(path, None) for path in evicted
+                       if path not in self._found and path not in self._missing]
+        for watch in watches:
+            if watch is not None:
+                watch.unsubscribe()
+
+    def _watch(self, path):
+        with self._lock:
+            if path in self._watches:
+                return
+            # Reserve the slot before subscribing so concurrent misses don't attach twice.
+            self._watches[path] = None
+
+        def on_change(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                with self._lock:
+                    if path not in self._watches:
+                        # Detached since this snapshot was sent.
+                        return
+                    if snapshot.exists:
+                        self._found[path] = snapshot.to_dict()
+                        self._missing.pop(path, None)
+                    else:
+                        self._found.pop(path, None)
+                        self._missing[path] = True
+            logging.info(f"Configuration refreshed from listener: {path}")
+            self._detach_evicted()
+
+        try:
+            watch = self.client_factory().document(path).on_snapshot(on_change)
+        except Exception:
+            logging.exception(f"Could not attach configuration listener: {path}")
+            with self._lock:
+                self._watches.pop(path, None)
+            return
+        with self._lock:
+            if path in self._watches:
+                self._watches[path] = watch
+                return
+        # Invalidated while subscribing.
+        watch.unsubscribe()
+
+
+location_configs = ConfigCache()
@@ -0,0 +1,41 @@
+import os
+import re
+from .keyed_index import KeyedIndex
+
+# Local index of (location, E.164 phone) -> GHL contact id, so repeat dials can update the
+# contact directly instead of calling contact_lookup first. CONTACT_INDEX_STORE=firestore
+# also shares entries between instances through the CONTACT_INDEX_COLLECTION collection.
+CONTACT_INDEX_SIZE = int(os.environ.get('CONTACT_INDEX_SIZE', '50000'))
+CONTACT_INDEX_STORE = os.environ.get('CONTACT_INDEX_STORE', '')
+CONTACT_INDEX_COLLECTION = os.environ.get('CONTACT_INDEX_COLLECTION', 'contactIndex')
+DEFAULT_COUNTRY_CODE = os.environ.get('DEFAULT_COUNTRY_CODE', '1')
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(raw, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalizes a dialed number to E.164. Numbers already starting with "+" keep their
+    country code; 10-digit numbers get the default country code (NANP: "1"), and
+    11-digit numbers starting with that code get a "+". Returns None for an empty number.
+    """
+    if raw is None:
+        return None
+    raw = raw.strip()
+    digits = _NON_DIGITS.sub('', raw)
+    if not digits:
+        return None
+    if raw.startswith('+'):
+        return f"+{digits}"
+    if raw.startswith('00'):
+        return f"+{digits[2:]}"
+    if len(digits) == 10 + len(country_code) and digits.startswith(country_code):
+        return f"+{digits}"
+    return f"+{country_code}{digits}"
+
+
+contact_index = KeyedIndex(
+    'contact_index', CONTACT_INDEX_COLLECTION,
+    to_document=lambda contact_id: {"contactId": contact_id},
+    from_document=lambda snapshot: snapshot.get('contactId'),
+    maxsize=CONTACT_INDEX_SIZE, store=CONTACT_INDEX_STORE)
@@ -0,0 +1,74 @@
+import os
+import time
+from .exceptions import DeadlineExceededError
+
+# Every webhook gets a REQUEST_DEADLINE second budget (keep it well below the function's
+# --timeout) shared by all of its Firestore and GHL calls: each call's timeout, rate-limit
+# wait and retry backoff is capped by what is left. When less than DEADLINE_DEFER_BELOW
+# seconds remain and follow-up jobs are enabled (jobs.FOLLOW_UP_JOBS), the call note and
+# opportunity sync are queued as a follow-up job instead of running inline; a note or
+# opportunity sync cut short by the deadline is queued (or logged for replay) the same way.
+# Calls are not started with less than DEADLINE_MIN_CALL seconds left.
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', '60'))
+DEADLINE_DEFER_BELOW = float(os.environ.get('DEADLINE_DEFER_BELOW', '10'))
+DEADLINE_MIN_CALL = float(os.environ.get('DEADLINE_MIN_CALL', '0.5'))
+
+
+class Deadline:
+    """
+    Time budget of one request, measured on time.monotonic().
+    """
+
+    def __init__(self, budget=None) -> None:
+        self.budget = REQUEST_DEADLINE if budget is None else budget
+        self.expires_at = time.monotonic() + self.budget
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def timeout(self, cap):
+        """
+        Returns the timeout for the next call: cap, or the remaining budget when that is
+        shorter. Raises DeadlineExceededError when too little is left to start a call.
+        """
+        remaining = self.remaining()
+        if remaining < DEADLINE_MIN_CALL:
+            raise DeadlineExceededError(self.budget)
+        return min(cap, remaining)
+
+    def allows(self, seconds):
+        """
+        True when at least `seconds` of the budget remain.
+        """
+        return self.remaining() >= seconds
+
+    def grace(self, cap):
+        """
+        Returns the timeout for a bookkeeping write that has to run even when the budget is
+        spent (releasing a record, queueing deferred work): the remaining budget capped at
+        cap, but at least DEADLINE_MIN_CALL.
+        """
+        return min(cap, max(self.remaining(), DEADLINE_MIN_CALL))
+
+
+class NoDeadline:
+    """
+    Stand-in for calls without a request budget (batch, queue worker, background refreshes).
+    """
+    budget = float('inf')
+    expires_at = float('inf')
+
+    def remaining(self):
+        return float('inf')
+
+    def timeout(self, cap):
+        return cap
+
+    def allows(self, seconds):
+        return True
+
+    def grace(self, cap):
+        return cap
+
+
+NO_DEADLINE = NoDeadline()
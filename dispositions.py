@@ -0,0 +1,164 @@
+import threading
+
+# Vici status code -> label written to the disposition custom field and the call note.
+# Codes match by longest prefix, case-insensitively ("NAU" is "NAU", not "N"). A location
+# can add, relabel or (with an empty label) drop codes with 'dispositionMapping' in its
+# Firestore configuration.
+DEFAULT_DISPOSITIONS = {
+    "DROP": "No Answer",
+    "ADC": "No Answer",
+    "PDROP": "Outbound Pre-Routing",
+    "A": "Answering Machine",
+    "AA": "Answering Machine Auto",
+    "AB": "Busy Auto",
+    "B": "Busy",
+    "CALLBK": "Call Back",
+    "CBL": "Call Back Later",
+    "DC": "Disconnected Number",
+    "DNC": "Do Not Call",
+    "Follow": "Follow Up",
+    "N": "No Answer",
+    "NAU": "No Answer",
+    "NA": "No Answer Autodial",
+    "NI": "Not Interested",
+    "NPRSN": "In Person Appointment",
+    "Nurtre": "Nurture",
+    "PHNAPT": "Phone Appointment",
+    "WN": "Wrong Number"
+}
+
+# Tag used when the location's dispositionTagMapping has no tag for the disposition.
+DEFAULT_TAG = "New Lead"
+
+_LABEL = ''  # trie key holding a node's label; never a character of a code
+
+
+class DispositionMatcher:
+    """
+    Longest-prefix matcher from Vici status codes to labels, compiled into a character
+    trie once per mapping. Exact codes (the common case) are answered from a dict.
+    """
+
+    def __init__(self, mapping) -> None:
+        self.exact = {}
+        self.root = {}
+        for code, label in mapping.items():
+            code = code.upper()
+            self.exact[code] = label
+            node = self.root
+            for char in code:
+                node = node.setdefault(char, {})
+            node[_LABEL] = label
+
+    def translate(self, disposition):
+        """
+        Returns the label of the longest code the disposition starts with, or "".
+        """
+        if not disposition:
+            return ""
+        disposition = disposition.upper()
+        label = self.exact.get(disposition)
+        if label is not None:
+            return label
+        label = ""
+        node = self.root
+        for char in disposition:
+            node = node.get(char)
+            if node is None:
+                break
+            label = node.get(_LABEL, label)
+        return label
+
+
+class TagIndex:
+    """
+    Reverse index of a dispositionTagMapping ({tag: [status codes]}) from status code to
+    tag. When a code is listed under several tags the first one wins, as before.
+    """
+
+    def __init__(self, tag_mapping) -> None:
+        self.tags = {}
+        for tag, codes in tag_mapping.items():
+            if isinstance(codes, str):
+                codes = [codes]
+            for code in codes or ():
+                self.tags.setdefault(code, tag)
+
+    def tags_for(self, disposition):
+        tag = self.tags.get(disposition) if disposition else None
+        return [tag or DEFAULT_TAG]
+
+
+class CompiledCache:
+    """
+    Compiles a matcher once per configuration value. Entries are keyed by the identity of
+    the value: configuration dicts are kept (and shared) by the config cache until the
+    document changes, so a lookup costs one dict probe instead of hashing the mapping.
+    """
+
+    def __init__(self, build, maxsize=256) -> None:
+        self.build = build
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        entry = self._entries.get(id(source))
+        # The entry holds a reference to its source, so the id cannot have been reused.
+        if entry is not None and entry[0] is source:
+            return entry[1]
+        compiled = self.build(source)
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                # Replaced configurations leave stale entries behind; start over.
+                self._entries.clear()
+            self._entries[id(source)] = (source, compiled)
+        return compiled
+
+
+def compile_dispositions(overrides):
+    mapping = {code.upper(): label for code, label in DEFAULT_DISPOSITIONS.items()}
+    for code, label in overrides.items():
+        if label:
+            mapping[code.upper()] = label
+        else:
+            mapping.pop(code.upper(), None)
+    return DispositionMatcher(mapping)
+
+
+DEFAULT_MATCHER = DispositionMatcher(DEFAULT_DISPOSITIONS)
+EMPTY_MATCHER = DispositionMatcher({})
+EMPTY_TAG_INDEX = TagIndex({})
+
+_matchers = CompiledCache(compile_dispositions)
+_stage_matchers = CompiledCache(DispositionMatcher)
+_tag_indexes = CompiledCache(TagIndex)
+
+
+def matcher_for(disposition_mapping=None):
+    """
+    Returns the matcher for a location's 'dispositionMapping' overrides
+    ({"STATUS": "Label"}; an empty label drops the code), or the default one.
+    """
+    if not disposition_mapping:
+        return DEFAULT_MATCHER
+    return _matchers.get(disposition_mapping)
+
+
+def stage_matcher_for(disposition_stage_mapping=None):
+    """
+    Returns the matcher for a location's 'dispositionStageMapping' ({"STATUS": "Stage name"}),
+    matched like the disposition labels.
+    """
+    if not disposition_stage_mapping:
+        return EMPTY_MATCHER
+    return _stage_matchers.get(disposition_stage_mapping)
+
+
+def tag_index_for(disposition_tag_mapping=None):
+    """
+    Returns the compiled TagIndex for a location's 'dispositionTagMapping'.
+    """
+    if not disposition_tag_mapping:
+        return EMPTY_TAG_INDEX
+    return _tag_indexes.get(disposition_tag_mapping)
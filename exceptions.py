@@ -1,4 +1,17 @@
 class ApiError(Exception):
     def __init__(self, status_code, message="Something went wrong, status code: {}") -> None:
+        self.status_code = status_code
         self.message = message.format(status_code)
         super().__init__(self.message)
+
+
+class CircuitOpenError(ApiError):
+    def __init__(self, location_id) -> None:
+        self.location_id = location_id
+        super().__init__(503, f"Circuit open for location {location_id}, GHL calls are paused. status code: {{}}")
+
+
+class DeadlineExceededError(ApiError):
+    def __init__(self, budget) -> None:
+        self.budget = budget
+        super().__init__(504, f"Request deadline of {budget:g}s exceeded, status code: {{}}")
@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import tracing
+
+# A location configuration can list extra GHL locations that receive every disposition:
+#   "fanOutTargets": ["locationB", {"locationID": "locationC", "fieldMapping": {...}}]
+# Each target uses its own configurations/{locationID} document, with the keys of a dict
+# entry (other than locationID) overriding it. Targets run in parallel with the primary
+# location and share one FANOUT_TIMEOUT deadline per webhook.
+FANOUT_TIMEOUT = float(os.environ.get('FANOUT_TIMEOUT', '20'))
+FANOUT_CONCURRENCY = int(os.environ.get('FANOUT_CONCURRENCY', '16'))
+FANOUT_MAX_TARGETS = int(os.environ.get('FANOUT_MAX_TARGETS', '10'))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def targets_for(config, primary_path):
+    """
+    Returns [(location path, config overrides)] for the fanOutTargets of a configuration.
+    The primary location and repeated targets are skipped; targets' own fanOutTargets
+    are not followed.
+    """
+    targets = []
+    seen = {primary_path}
+    for entry in config.get('fanOutTargets') or ():
+        if isinstance(entry, str):
+            location, overrides = entry, {}
+        else:
+            overrides = {key: value for key, value in entry.items() if key not in ('locationID', 'fanOutTargets')}
+            location = entry.get('locationID')
+        if not location:
+            logging.warning(f"Fan-out target without locationID in {primary_path}: {entry}")
+            continue
+        location_path = location if "/" in location else f"configurations/{location}"
+        if location_path in seen:
+            continue
+        seen.add(location_path)
+        targets.append((location_path, overrides))
+    if len(targets) > FANOUT_MAX_TARGETS:
+        logging.warning(f"{primary_path} lists {len(targets)} fan-out targets, using the first {FANOUT_MAX_TARGETS}")
+        targets = targets[:FANOUT_MAX_TARGETS]
+    return targets
+
+
+def get_executor():
+    """
+    Returns the process-wide executor that runs fan-out targets. It is not tied to a
+    request, so a target still running at the deadline does not hold up the response.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_CONCURRENCY, thread_name_prefix='fanout')
+    return _executor
+
+
+def submit(location_id, fn, *args):
+    """
+    Starts fn(*args) for one target and returns a (location id, future) handle for collect().
+    """
+    def run():
+        with tracing.span("fanout.target", location_id=location_id):
+            return fn(*args)
+    return location_id, get_executor().submit(run)
+
+
+def collect(pending, deadline):
+    """
+    Waits for submitted targets until the time.monotonic() deadline and returns one
+    result dict per target, in submission order. A target that returned None had no
+    configuration (404); targets still running at the deadline are reported with
+    status 504 and left to finish in the background.
+    """
+    wait([future for _, future in pending], timeout=max(0.0, deadline - time.monotonic()))
+    results = []
+    for location_id, future in pending:
+        result = {"locationID": location_id}
+        if not future.done():
+            logging.error(f"Fan-out target {location_id} did not finish before the deadline")
+            result.update(status=504, error="Fan-out deadline exceeded")
+        elif future.exception() is not None:
+            logging.error(f"Fan-out target {location_id} failed: {future.exception()}")
+            result.update(status=500, error=str(future.exception()))
+        elif future.result() is None:
+            result.update(status=404, error=f"Configuration document not found for {location_id}")
+        else:
+            result.update(status=200, contact_id=future.result())
+        results.append(result)
+    return results
@@ -0,0 +1,179 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future
+from cachetools import TTLCache
+from . import tracing
+from .config_cache import get_client
+from .deadline import NO_DEADLINE
+
+# Duplicate dispositions (same location, lead and disposition inside one time bucket) are
+# coalesced: concurrent duplicates in one instance share a single in-flight run, later ones
+# get the stored result. IDEMPOTENCY_STORE=firestore also suppresses duplicates that land on
+# other instances through short-lived records in IDEMPOTENCY_COLLECTION (add a Firestore TTL
+# policy on expireAt to clean them up).
+IDEMPOTENCY_WINDOW = float(os.environ.get('IDEMPOTENCY_WINDOW', '60'))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_STORE = os.environ.get('IDEMPOTENCY_STORE', '')
+IDEMPOTENCY_COLLECTION = os.environ.get('IDEMPOTENCY_COLLECTION', 'idempotencyKeys')
+
+
+def idempotency_key(lead, window=IDEMPOTENCY_WINDOW, now=None):
+    """
+    Builds the key for a lead: location, Vici lead id (or the phone when Vici sent no
+    lead id), disposition and the time bucket the request falls in.
+    """
+    lead_id = lead['params'].get('leadID')
+    subject = lead_id if lead_id and lead_id != '0' else lead['phone']
+    bucket = int((now if now is not None else time.time()) // window)
+    return f"{lead['location_path']}|{subject}|{lead['disposition'] or ''}|{bucket}"
+
+
+def previous_bucket_key(key):
+    """
+    Returns the key of the same lead and disposition in the preceding time bucket.
+    """
+    base, bucket = key.rsplit('|', 1)
+    return f"{base}|{int(bucket) - 1}"
+
+
+def expire_at(seconds):
+    """
+    Timestamp for the expireAt field read by a Firestore TTL policy.
+    """
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+class Idempotency:
+
+    def __init__(self, window=IDEMPOTENCY_WINDOW, maxsize=IDEMPOTENCY_CACHE_SIZE, store=IDEMPOTENCY_STORE,
+                 collection=IDEMPOTENCY_COLLECTION, client_factory=get_client) -> None:
+        self.window = window
+        self.store = store
+        self.collection = collection
+        self.client_factory = client_factory
+        # Entries map a key to (result, start time) and are kept for two windows: run() also
+        # looks up the previous bucket's key, so a duplicate that lands just after a bucket
+        # boundary still finds the original's result.
+        self._completed = TTLCache(maxsize=maxsize, ttl=window * 2)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn, deadline=NO_DEADLINE):
+        """
+        Runs fn() once per key and returns (result, duplicate). Duplicates get the result
+        of the original run, or None when the original is running on another instance.
+        Failures and None results are not remembered, so a retry after an error runs again.
+        A run under the previous bucket's key counts as the original too when it started
+        less than one window earlier, so duplicates at most one window apart are coalesced
+        even across a bucket boundary, and ones further apart never are.
+        The shared records' Firestore calls are bounded by deadline (a deadline.Deadline).
+        """
+        previous = previous_bucket_key(key)
+        started = time.time()
+        with self._lock:
+            if key in self._completed:
+                return self._completed[key][0], True
+            if previous in self._completed and self._recent(self._completed[previous][1], started):
+                return self._completed[previous][0], True
+            future = self._in_flight.get(key) or self._in_flight.get(previous)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            logging.info(f"Coalesced duplicate request: {key}")
+            return future.result(), True
+
+        try:
+            claimed, result = self._claim(key, previous, started, deadline)
+            if not claimed:
+                logging.info(f"Duplicate request handled by another instance: {key}")
+                future.set_result(result)
+                return result, True
+            result = fn()
+            future.set_result(result)
+            if result is None:
+                self._release(key, deadline)
+            else:
+                self._store_result(key, result, deadline)
+                with self._lock:
+                    self._completed[key] = (result, started)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            self._release(key, deadline)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _recent(self, original_started, started):
+        return started - original_started < self.window
+
+    def clear(self):
+        with self._lock:
+            self._completed.clear()
+
+    def _document(self, key):
+        if self.store != 'firestore':
+            return None
+        document_id = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.client_factory().collection(self.collection).document(document_id)
+
+    def _claim(self, key, previous, started, deadline=NO_DEADLINE):
+        """
+        Creates the shared record for key. Returns (True, None) when this instance owns the
+        key, or (False, stored result) when another instance created it first, or created
+        the record of the previous bucket less than one window before started.
+        """
+        document = self._document(key)
+        if document is None:
+            return True, None
+        from google.api_core.exceptions import AlreadyExists
+        try:
+            snapshot = self._document(previous).get(timeout=deadline.timeout(5))
+            if snapshot.exists:
+                record = snapshot.to_dict()
+                # Records written before startedAt existed count as recent.
+                if self._recent(record.get('startedAt', started), started):
+                    return False, record.get('result')
+        except Exception:
+            logging.exception(f"Idempotency record of the previous bucket could not be read: {previous}")
+        try:
+            with tracing.span("firestore.create", endpoint="idempotency"):
+                document.create({"key": key, "result": None, "startedAt": started,
+                                 "expireAt": expire_at(self.window * 2)},
+                                timeout=deadline.timeout(5))
+            return True, None
+        except AlreadyExists:
+            snapshot = document.get(timeout=deadline.timeout(5))
+            return False, snapshot.get('result') if snapshot.exists else None
+        except Exception:
+            # The shared record is an optimization; never fail the webhook because of it.
+            logging.exception(f"Idempotency record could not be created: {key}")
+            return True, None
+
+    def _store_result(self, key, result, deadline=NO_DEADLINE):
+        document = self._document(key)
+        if document is None:
+            return
+        try:
+            document.update({"result": result}, timeout=deadline.grace(5))
+        except Exception:
+            logging.exception(f"Idempotency result could not be stored: {key}")
+
+    def _release(self, key, deadline=NO_DEADLINE):
+        document = self._document(key)
+        if document is None:
+            return
+        try:
+            # Runs even when the run ran out of budget, or the key would stay claimed.
+            document.delete(timeout=deadline.grace(5))
+        except Exception:
+            logging.exception(f"Idempotency record could not be released: {key}")
+
+
+idempotency = Idempotency()
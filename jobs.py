@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+import logging
+from .config_cache import get_client
+from .contact_index import normalize_phone
+
+# Queue mode settings. QUEUE_MODE=1 makes vici_to_ghl persist a job and answer 202;
+# vici_queue_worker drains the queue. QUEUE_BACKEND selects "firestore" (prod) or
+# "sqlite" (local runs and tests).
+QUEUE_MODE = os.environ.get('QUEUE_MODE', '0') == '1'
+QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'firestore')
+QUEUE_SQLITE_PATH = os.environ.get('QUEUE_SQLITE_PATH', '/tmp/vici_jobs.db')
+QUEUE_COLLECTION = os.environ.get('QUEUE_COLLECTION', 'viciJobs')
+QUEUE_DEAD_LETTER_COLLECTION = os.environ.get('QUEUE_DEAD_LETTER_COLLECTION', 'viciDeadLetters')
+QUEUE_BATCH_SIZE = int(os.environ.get('QUEUE_BATCH_SIZE', '100'))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get('QUEUE_MAX_ATTEMPTS', '5'))
+QUEUE_LEASE_SECONDS = float(os.environ.get('QUEUE_LEASE_SECONDS', '300'))
+QUEUE_DEDUPE_SECONDS = float(os.environ.get('QUEUE_DEDUPE_SECONDS', '600'))
+QUEUE_RETRY_DELAY = float(os.environ.get('QUEUE_RETRY_DELAY', '60'))
+# Webhooks short on deadline queue their note and opportunity sync as follow-up jobs only
+# when a vici_queue_worker is deployed to run them (default: only in queue mode).
+FOLLOW_UP_JOBS = os.environ.get('FOLLOW_UP_JOBS', '1' if QUEUE_MODE else '0') == '1'
+
+# Jobs in these states are still to be run; a job with the same dedupe key is a duplicate.
+ACTIVE_STATUSES = ('pending', 'leased')
+
+
+def compact_job(params):
+    """
+    Returns the job record stored for a request: the non-empty query parameters.
+    """
+    return {k: v for k, v in params.items() if v not in (None, '')}
+
+
+def dedupe_key(job):
+    """
+    Jobs for the same (locationID, leadID, disposition) inside the dedupe window are
+    collapsed into one. Without a Vici lead id the normalized phone stands in for it, so
+    different leads are not collapsed. Follow-up jobs (deferred steps of a webhook) are
+    keyed apart from the lead's own job. The key is hashed so it is safe to use as a document id.
+    """
+    lead_id = job.get('leadID')
+    subject = lead_id if lead_id and lead_id != '0' else f"phone:{normalize_phone(job.get('dialedNumber')) or ''}"
+    raw = "|".join([job.get('locationID', ''), subject, job.get('disposition', '')])
+    if job.get('followUp'):
+        raw += "|followUp|" + job['followUp']
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class SQLiteJobQueue:
+    """
+    File-backed queue used for local runs and tests. Safe to share between threads of one process.
+    """
+
+    def __init__(self, path=QUEUE_SQLITE_PATH, max_attempts=QUEUE_MAX_ATTEMPTS,
+                 lease_seconds=QUEUE_LEASE_SECONDS, dedupe_seconds=QUEUE_DEDUPE_SECONDS) -> None:
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.dedupe_seconds = dedupe_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, dedupe_key TEXT UNIQUE, payload TEXT, status TEXT, "
+            "attempts INTEGER, created_at REAL, leased_until REAL, last_error TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, leased_until)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "id TEXT PRIMARY KEY, payload TEXT, error TEXT, attempts INTEGER, failed_at REAL)")
+
+    def enqueue(self, job, timeout=None):
+        """
+        Stores a job. Returns (job id, False), or (existing job id, True) for a duplicate:
+        a job with the same dedupe key that is still pending or leased, or that was queued
+        less than dedupe_seconds ago. timeout (seconds) bounds the wait for the database lock.
+        """
+        key = dedupe_key(job)
+        now = time.time()
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError("Job queue is busy")
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, created_at, status FROM jobs WHERE dedupe_key = ?", (key,)).fetchone()
+                if row and (row[2] in ACTIVE_STATUSES or now - row[1] < self.dedupe_seconds):
+                    self._db.execute("COMMIT")
+                    return row[0], True
+                if row:
+                    # Finished and outside the window: the old record only served dedupe, free the key.
+                    self._db.execute("UPDATE jobs SET dedupe_key = NULL WHERE id = ?", (row[0],))
+                job_id = uuid.uuid4().hex
+                self._db.execute(
+                    "INSERT INTO jobs (id, dedupe_key, payload, status, attempts, created_at, leased_until) "
+                    "VALUES (?, ?, ?, 'pending', 0, ?, 0)", (job_id, key, json.dumps(job), now))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        finally:
+            self._lock.release()
+        return job_id, False
+
+    def claim(self, limit=QUEUE_BATCH_SIZE):
+        """
+        Leases up to `limit` pending (or lease-expired) jobs and returns [(job id, job)].
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, payload FROM jobs WHERE status IN ('pending', 'leased') AND leased_until <= ? "
+                    "ORDER BY created_at LIMIT ?", (now, limit)).fetchall()
+                self._db.executemany(
+                    "UPDATE jobs SET status = 'leased', leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def complete(self, job_id):
+        with self._lock:
+            # The payload is dropped; the row is kept only for dedupe until it ages out.
+            self._db.execute("UPDATE jobs SET status = 'done', payload = NULL WHERE id = ?", (job_id,))
+            self._db.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND created_at < ?", (time.time() - self.dedupe_seconds,))
+
+    def fail(self, job_id, error):
+        """
+        Returns the job to the queue (claimable again after QUEUE_RETRY_DELAY * attempts
+        seconds), or moves it to the dead-letter table after max_attempts.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT payload, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            if row[1] >= self.max_attempts:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO dead_letters (id, payload, error, attempts, failed_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, row[0], error, row[1], time.time()))
+                self._db.execute("UPDATE jobs SET status = 'dead', payload = NULL WHERE id = ?", (job_id,))
+                logging.error(f"Job moved to dead letters: {job_id} {error}")
+            else:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'pending', leased_until = ?, last_error = ? WHERE id = ?",
+                    (time.time() + QUEUE_RETRY_DELAY * row[1], error, job_id))
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, payload, error, attempts FROM dead_letters ORDER BY failed_at LIMIT ?", (limit,)).fetchall()
+        return [{"id": r[0], "job": json.loads(r[1]), "error": r[2], "attempts": r[3]} for r in rows]
+
+
+class FirestoreJobQueue:
+    """
+    Firestore-backed queue. The job document id is the dedupe key, so duplicates
+    are detected with a single transactional read.
+    """
+
+    def __init__(self, client=None, collection=QUEUE_COLLECTION, dead_letter_collection=QUEUE_DEAD_LETTER_COLLECTION,
+                 max_attempts=QUEUE_MAX_ATTEMPTS, lease_seconds=QUEUE_LEASE_SECONDS,
+                 dedupe_seconds=QUEUE_DEDUPE_SECONDS) -> None:
+        self.client = client if client is not None else get_client()
+        self.jobs = self.client.collection(collection)
+        self.dead = self.client.collection(dead_letter_collection)
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.dedupe_seconds = dedupe_seconds
+
+    def enqueue(self, job, timeout=None):
+        """
+        Stores a job. Returns (job id, False), or (existing job id, True) for a duplicate:
+        a job with the same dedupe key that is still pending or leased, or that was queued
+        less than dedupe_seconds ago. A finished (done or dead) job outside the window is
+        replaced; replacing a pending or leased one would reset its attempts and let the
+        old claim's complete() mark the new job done. timeout (seconds) bounds the
+        transactional read.
+        """
+        from google.cloud import firestore
+        ref = self.jobs.document(dedupe_key(job))
+        now = time.time()
+
+        @firestore.transactional
+        def create(transaction):
+            snapshot = ref.get(transaction=transaction, timeout=timeout)
+            if snapshot.exists and (snapshot.get('status') in ACTIVE_STATUSES
+                                    or now - snapshot.get('createdAt') < self.dedupe_seconds):
+                return True
+            transaction.set(ref, {
+                "payload": job, "status": "pending", "attempts": 0,
+                "createdAt": now, "leasedUntil": 0,
+            })
+            return False
+
+        duplicate = create(self.client.transaction())
+        return ref.id, duplicate
+
+    def claim(self, limit=QUEUE_BATCH_SIZE):
+        from google.cloud import firestore
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        now = time.time()
+        candidates = (self.jobs
+                      .where(filter=FieldFilter("status", "in", ["pending", "leased"]))
+                      .where(filter=FieldFilter("leasedUntil", "<=", now))
+                      .limit(limit)
+                      .stream())
+        claimed = []
+        for candidate in candidates:
+            @firestore.transactional
+            def lease(transaction, ref=candidate.reference):
+                snapshot = ref.get(transaction=transaction)
+                if not snapshot.exists or snapshot.get('status') not in ('pending', 'leased') \
+                        or snapshot.get('leasedUntil') > now:
+                    return None
+                transaction.update(ref, {
+                    "status": "leased",
+                    "leasedUntil": now + self.lease_seconds,
+                    "attempts": snapshot.get('attempts') + 1,
+                })
+                return snapshot.get('payload')
+
+            payload = lease(self.client.transaction())
+            if payload is not None:
+                claimed.append((candidate.id, payload))
+        return claimed
+
+    def complete(self, job_id):
+        # Kept (without payload) until the dedupe window ends; a Firestore TTL policy on
+        # expireAt removes it afterwards.
+        self.jobs.document(job_id).update({
+            "status": "done", "payload": None,
+            "expireAt": datetime.now(timezone.utc) + timedelta(seconds=self.dedupe_seconds),
+        })
+
+    def fail(self, job_id, error):
+        ref = self.jobs.document(job_id)
+        snapshot = ref.get()
+        if not snapshot.exists:
+            return
+        if snapshot.get('attempts') >= self.max_attempts:
+            self.dead.document(job_id).set({
+                "payload": snapshot.get('payload'), "error": error,
+                "attempts": snapshot.get('attempts'), "failedAt": time.time(),
+            })
+            ref.update({"status": "dead", "payload": None})
+            logging.error(f"Job moved to dead letters: {job_id} {error}")
+        else:
+            ref.update({
+                "status": "pending", "lastError": error,
+                "leasedUntil": time.time() + QUEUE_RETRY_DELAY * snapshot.get('attempts'),
+            })
+
+    def dead_letters(self, limit=100):
+        return [{"id": doc.id, "job": doc.get('payload'), "error": doc.get('error'), "attempts": doc.get('attempts')}
+                for doc in self.dead.limit(limit).stream()]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Returns the process-wide job queue for the configured QUEUE_BACKEND.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if QUEUE_BACKEND == 'sqlite':
+                    _queue = SQLiteJobQueue()
+                elif QUEUE_BACKEND == 'firestore':
+                    _queue = FirestoreJobQueue()
+                else:
+                    raise ValueError(f"Unknown QUEUE_BACKEND: {QUEUE_BACKEND}")
+    return _queue
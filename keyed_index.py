@@ -0,0 +1,88 @@
+import time
+import logging
+import threading
+from cachetools import LRUCache
+from . import tracing
+from .config_cache import get_client
+
+
+class KeyedIndex:
+    """
+    Bounded in-memory LRU of (location, key) -> value, optionally backed by a shared
+    Firestore collection (store="firestore") with one document per entry, named
+    "{location}_{key}". to_document turns a value into the document fields and
+    from_document reads it back from a snapshot.
+    """
+
+    def __init__(self, name, collection, to_document, from_document, maxsize, store='',
+                 client_factory=get_client) -> None:
+        self.name = name
+        self.collection = collection
+        self.to_document = to_document
+        self.from_document = from_document
+        self.store = store
+        self.client_factory = client_factory
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def _shared(self, location_id, key):
+        if self.store != 'firestore':
+            return None
+        return self.client_factory().collection(self.collection).document(f"{location_id}_{key}")
+
+    def get(self, location_id, key, timeout=5):
+        """
+        Returns the known value for key in the location, or None.
+        """
+        if not key:
+            return None
+        with self._lock:
+            value = self._entries.get((location_id, key))
+        if value is not None:
+            return value
+        document = self._shared(location_id, key)
+        if document is None:
+            return None
+        try:
+            with tracing.span("firestore.get", endpoint=self.name):
+                snapshot = document.get(timeout=timeout)
+        except Exception:
+            logging.exception(f"{self.name} read failed: {location_id} {key}")
+            return None
+        if not snapshot.exists:
+            return None
+        value = self.from_document(snapshot)
+        with self._lock:
+            self._entries[(location_id, key)] = value
+        return value
+
+    def put(self, location_id, key, value, timeout=5):
+        if not key or not value:
+            return
+        with self._lock:
+            if self._entries.get((location_id, key)) == value:
+                return
+            self._entries[(location_id, key)] = value
+        document = self._shared(location_id, key)
+        if document is not None:
+            try:
+                document.set(dict(self.to_document(value), updatedAt=time.time()), timeout=timeout)
+            except Exception:
+                logging.exception(f"{self.name} write failed: {location_id} {key}")
+
+    def discard(self, location_id, key, timeout=5):
+        """
+        Forgets a stale entry, e.g. after GHL answered 404 for the indexed object.
+        """
+        with self._lock:
+            self._entries.pop((location_id, key), None)
+        document = self._shared(location_id, key)
+        if document is not None:
+            try:
+                document.delete(timeout=timeout)
+            except Exception:
+                logging.exception(f"{self.name} delete failed: {location_id} {key}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
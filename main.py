@@ -1,15 +1,50 @@
 import os
+import json
+import time
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import functions_framework
-from google.cloud import firestore
-from flask import jsonify, Request
+from flask import jsonify, Request, Response, stream_with_context
 from .apps import GHL  # Assuming GHL is imported from the apps module
+from .config_cache import location_configs, is_not_found
+from .metadata import location_metadata
+from . import batch
+from . import jobs
+from . import tracing
+from . import fanout
+from . import warmup
+from .contact_index import contact_index, normalize_phone
+from .exceptions import ApiError, DeadlineExceededError
+from .deadline import Deadline, NO_DEADLINE, DEADLINE_DEFER_BELOW
+from .idempotency import idempotency, idempotency_key
+from .write_buffer import contact_writes, contact_state
+from .mapping import DEFAULT_MAPPING, mapping_for, is_placeholder
+from .dispositions import matcher_for, stage_matcher_for, tag_index_for
+from .opportunity_index import opportunity_index, opportunity_entry
 import logging
-import re
 
 # Configure logging for structured output (could be extended to use Stackdriver if needed)
 logging.basicConfig(level=logging.INFO)
 
+REQUIRED_PARAMS = ['firstName', 'lastName', 'dialedNumber', 'locationID']
+
+# Independent calls of one lead overlap on a process-wide pool of LEAD_CONCURRENCY threads:
+# the metadata load with the contact index read and lookup, and the call note with the
+# opportunity sync once the contact exists.
+LEAD_CONCURRENCY = int(os.environ.get('LEAD_CONCURRENCY', '32'))
+
+_lead_executor = None
+_lead_executor_lock = threading.Lock()
+
+# Build the Firestore client and HTTP session in the background while the instance starts.
+if warmup.STARTUP_WARMUP:
+    warmup.start()
+
+
 @functions_framework.http
+@tracing.serves_metrics
+@tracing.traced_handler
 def vici_to_ghl(request: Request):
     """
     HTTP Cloud Function to process Vici data and integrate with GHL.
@@ -18,328 +53,673 @@ def vici_to_ghl(request: Request):
     """
     try:
         # Validate required query parameters.
-        required_params = ['firstName', 'lastName', 'dialedNumber', 'locationID']
-        missing_params = [p for p in required_params if not request.args.get(p)]
-        if missing_params:
-            error_msg = f"Missing required query parameters: {', '.join(missing_params)}"
+        error_msg = validate_params(request.args)
+        if error_msg:
             logging.error(error_msg)
             return jsonify({"error": error_msg}), 400
 
-        # Extract and normalize query parameters.
-        params = request.args
-        first_name = params.get('firstName')
-        last_name = params.get('lastName')
-        dialed_number = params.get('dialedNumber')
-        disposition = params.get('disposition')
-        campaign_id = params.get('campaignID')
-        term_reason = params.get('termReason')
-        call_note = params.get('callNote')
-        email = params.get('email')
-        list_id = params.get('listID')
-        lead_id = params.get('leadID', '0')
-        location_path = params.get('locationID')
-        city = params.get('city')
-        state = params.get('state')
-        zip_code = params.get('zip')
-        country = params.get('country')
-        lead_type = params.get('leadType', '')
-        agent_assigned = params.get('agentAssigned', '')
-        alt_number = params.get('altNumber', '')
-        home_value = params.get('homeValue', '')
-        create_date = params.get('createDate', '')
-        equity = params.get('equity', '')
-        crm_name = params.get('crmName', '')
-        contact_link = params.get('contactLink', '')
-        build_date = params.get('buildDate', '')
-        listing_agent = params.get('listingAgent', '')
-        baths = params.get('baths', '')
-        buyer_agent = params.get('buyerAgent', '')
-        beds = params.get('beds', '')
-        lot_size = params.get('lotSize', '')
-        sqft = params.get('sqft', '')
-        build=params.get('build', '')
-        home_value = params.get('homeValue', '')
-        sq_ft = params.get('sqFt', '')
-        county = params.get('county', '')
-        zestimate = params.get('zestimate', '')
-        last_submission = params.get('lastSubmission', '')
-        tag = params.get('tag', '')
-        lead_score = params.get('leadScore', '')
-        last_submission_date = params.get('lastSubmissionDate', '')
-        estimated_price = params.get('estimatedPrice', '')
-        last_number_dialed = params.get('lastNumberDialed', '')
-        days_on_market = params.get('daysOnMarket', '')
-        final_question = params.get('finalQuestion', '')
-        alt_number = params.get('altNumber', '')
-        listing_status = params.get('listingStatus', '')
-        team_member = params.get('teamMember', '')
-        bathrooms = params.get('bathrooms', '')
-        motivation = params.get('motivation', '')
-        secondary_number = params.get('secondaryNumber', '')
-        homeowner= params.get('homeowner', '')
-        home_to_sell_or_buy = params.get('homeToSellOrBuy', '')
-        areas_of_interest = params.get('areasOfInterest', '')
-        pending_repairs = params.get('pendingRepairs', '')
-        non_negotiables = params.get('nonNegotiables', '')
-        timeframe = params.get('timeframe', '')
-        bedrooms = params.get('bedrooms', '')
-        lender = params.get('lender', '')
-        recent_upgrades = params.get('recentUpgrades', '')
-
-        # Initialize Firestore client.
-        fs_client = firestore.Client()
-
-        # Ensure the document path is fully qualified (e.g., "configurations/{locationID}")
-        if "/" not in location_path:
-            location_path = f"configurations/{location_path}"
-
-        # Retrieve configuration with a timeout.
-        config_ref = fs_client.document(location_path)
-        config_snapshot = config_ref.get(timeout=10)
-        if not config_snapshot.exists:
-            error_msg = f"Configuration document not found: {location_path}"
-            logging.error(error_msg)
+        # In queue mode the job is persisted and processed later by vici_queue_worker.
+        if jobs.QUEUE_MODE:
+            with tracing.span("queue.enqueue", endpoint=jobs.QUEUE_BACKEND):
+                job_id, duplicate = jobs.get_queue().enqueue(jobs.compact_job(request.args.to_dict()))
+            logging.info(f"Job {'deduplicated' if duplicate else 'queued'}: {job_id}")
+            return jsonify({"job_id": job_id, "duplicate": duplicate}), 202
+
+        lead = extract_lead(request.args)
+        deadline = Deadline()
+        # Duplicate dispositions for the same lead are coalesced onto one run.
+        result, duplicate = idempotency.run(idempotency_key(lead), lambda: handle_lead(lead, deadline),
+                                            deadline)
+        return lead_response(lead, result, duplicate)
+
+    except Exception as e:
+        if isinstance(e, DeadlineExceededError):
+            logging.error(e.message)
+            return jsonify({"error": e.message}), 504
+        if is_not_found(e):
+            error_msg = "Firestore document not found or misconfigured."
+            logging.exception(error_msg)
             return jsonify({"error": error_msg}), 404
+        logging.exception("Unexpected error occurred.")
+        return jsonify({"error": str(e)}), 500
+
+
+@functions_framework.http
+@tracing.serves_metrics
+@tracing.traced_handler
+def vici_batch_to_ghl(request: Request):
+    """
+    HTTP Cloud Function for bulk Vici disposition uploads (backfills and replays).
+    The body is JSON-lines or CSV, one lead per row with the vici_to_ghl parameter names.
+    Results are streamed back as JSON lines, one per input row, in completion order.
+    """
+    try:
+        rows = batch.parse_rows(request.get_data(as_text=True), request.content_type)
+    except ValueError as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 400
+    logging.info(f"Batch received: {len(rows)} rows")
+    results = (json.dumps(result) + "\n" for result in process_batch(rows))
+    return Response(stream_with_context(results), mimetype='application/x-ndjson')
+
+
+@functions_framework.http
+@tracing.serves_metrics
+@tracing.traced_handler
+def vici_queue_worker(request: Request):
+    """
+    HTTP Cloud Function (e.g. triggered by Cloud Scheduler) that drains queued jobs.
+    Jobs are claimed in batches and run through process_batch until the queue is empty
+    or `maxBatches` batches have been processed. Failed jobs are retried on a later run
+    and moved to the dead-letter store after QUEUE_MAX_ATTEMPTS attempts.
+    """
+    try:
+        queue = jobs.get_queue()
+        max_batches = int(request.args.get('maxBatches', '10'))
+        summary = {"processed": 0, "failed": 0}
+        for _ in range(max_batches):
+            with tracing.span("queue.claim", endpoint=jobs.QUEUE_BACKEND) as trace:
+                claimed = queue.claim(jobs.QUEUE_BATCH_SIZE)
+                trace.set(jobs=len(claimed))
+            if not claimed:
+                break
+            for result in process_batch([job for _, job in claimed]):
+                job_id = claimed[result['row']][0]
+                if result['status'] == 200:
+                    queue.complete(job_id)
+                    summary["processed"] += 1
+                else:
+                    queue.fail(job_id, result['error'])
+                    summary["failed"] += 1
+        logging.info(f"Queue worker finished: {summary}")
+        return jsonify(summary), 200
+    except Exception as e:
+        logging.exception("Unexpected error occurred.")
+        return jsonify({"error": str(e)}), 500
+
+
+def handle_lead(lead, deadline=NO_DEADLINE):
+    """
+    Loads the location configuration and metadata and runs process_lead for one lead,
+    while the location's fan-out targets run in parallel. Every Firestore and GHL call
+    made for the lead, fan-out targets included, is bounded by the request deadline.
+    Returns the result from lead_result, or None when the location configuration does not exist.
+    """
+    location_path = lead['location_path']
+
+    # Retrieve configuration with a timeout (served from the in-memory cache when warm).
+    config = location_configs.get(location_path, timeout=deadline.timeout(10))
+    if config is None:
+        return None
+    targets_deadline = fanout_deadline(deadline)
+    pending = start_targets(lead, config, deadline=deadline)
+
+    # Instantiate the GHL client for external API interaction.
+    app_instance = GHL(config.get('locationApiKey', ''), location_id_from_path(location_path), deadline=deadline)
+
+    # Custom field and pipeline definitions (cached per location) load alongside the lookup.
+    contact_id = process_lead(app_instance, lead, config)
+    return lead_result(contact_id, fanout.collect(pending, targets_deadline))
+
+
+def fanout_deadline(deadline):
+    """
+    Returns the time.monotonic() deadline for collecting fan-out targets, taken when the
+    targets start: FANOUT_TIMEOUT from now, but never past the request deadline.
+    """
+    return min(time.monotonic() + fanout.FANOUT_TIMEOUT, deadline.expires_at)
+
+
+def start_targets(lead, config, write_window=None, add_note=True, deadline=NO_DEADLINE):
+    """
+    Starts process_target for every fan-out target of the location and returns the
+    handles to pass to fanout.collect.
+    """
+    return [fanout.submit(location_id_from_path(location_path), process_target, lead, location_path, overrides,
+                          write_window, add_note, deadline)
+            for location_path, overrides in fanout.targets_for(config, lead['location_path'])]
+
+
+def process_target(lead, location_path, overrides, write_window=None, add_note=True, deadline=NO_DEADLINE):
+    """
+    Runs process_lead for one fan-out target with its own configuration (and the
+    overrides from the fanOutTargets entry). Returns the contact id, or None when the
+    target's configuration document does not exist.
+    Configuration and metadata come from the same caches as the primary location's.
+    """
+    config = location_configs.get(location_path, timeout=deadline.timeout(10))
+    if config is None:
+        return None
+    config = dict(config, **overrides)
+    app_instance = GHL(config.get('locationApiKey', ''), location_id_from_path(location_path), deadline=deadline)
+    return process_lead(app_instance, lead, config, None, write_window, add_note)
+
+
+def lead_result(contact_id, targets):
+    """
+    Builds the result of a processed lead: the primary contact id, plus one result
+    per fan-out target when the location has any.
+    """
+    result = {"contact_id": contact_id}
+    if targets:
+        result["targets"] = targets
+    return result
+
+
+def lead_response(lead, result, duplicate):
+    """
+    Builds the HTTP response for a processed lead. A duplicate handled on another
+    instance may not know the result yet.
+    """
+    if duplicate:
+        return jsonify(dict(result or {"contact_id": None}, duplicate=True)), 200
+    if result is None:
+        error_msg = f"Configuration document not found: {lead['location_path']}"
+        logging.error(error_msg)
+        return jsonify({"error": error_msg}), 404
+    return jsonify(result), 200
 
-        config = config_snapshot.to_dict()
-        location_key = config.get('locationApiKey', '')
-        user_id = config.get('userID', '')
-        # Derive a simple location ID from the document path.
-        location_id = location_path.split('/')[-1]
-
-        # Instantiate the GHL client for external API interaction.
-        app_instance = GHL(location_key, location_id)
-
-        # Build the query for contact lookup.
-        query = f"phone=+1{dialed_number.strip()}"
-
-        disposition_translated = set_disposition_translated(disposition)
-
-        # Retrieve custom field definitions (assuming this is a method on GHL).
-        custom_fields = app_instance.get_custom_fields()
-        custom_fields_values = {
-            "disposition": disposition_translated,
-            "term_reason": term_reason,
-            "list_id": list_id,
-            "lead_id": lead_id,
-            "campaign": campaign_id,
-            "lead_type": lead_type,
-            "agent_assigned": agent_assigned,
-            "alt_number": alt_number,
-            "home_value": home_value,
-            "create_date": create_date,
-            "equity": equity,
-            "crm_name": crm_name,
-            "contact_link": contact_link,
-            "build_date": build_date,
-            "listing_agent": listing_agent,
-            "baths": baths,
-            "buyer_agent": buyer_agent,
-            "beds": beds,
-            "lot_size": lot_size,
-            "sqft": sqft,
-            "build": build,
-            "home_value": home_value,
-            "sq_ft": sq_ft,
-            "county": county,
-            "zestimate": zestimate,
-            "last_submission": last_submission,
-            "tag": tag,
-            "lead_score": lead_score,
-            "last_submission_date": last_submission_date,
-            "estimated_price": estimated_price,
-            "last_number_dialed": last_number_dialed,
-            "days_on_market": days_on_market,
-            "final_question": final_question,
-            "alt_number": alt_number,
-            "listing_status": listing_status,
-            "team_member": team_member,
-            "bathrooms": bathrooms,
-            "motivation": motivation,
-            "secondary_number": secondary_number,
-            "homeowner": homeowner,
-            "home_to_sell_or_buy": home_to_sell_or_buy,
-            "areas_of_interest": areas_of_interest,
-            "pending_repairs": pending_repairs,
-            "non_negotiables": non_negotiables,
-            "timeframe": timeframe,
-            "bedrooms": bedrooms,
-            "lender": lender,
-            "recent_upgrades": recent_upgrades,
-            "notes": call_note,
-        }
-        # Clean custom_fields_values to remove template placeholders
-        custom_fields_values = clean_custom_fields_values(custom_fields_values)
-
-        # Prepare contact data with custom fields.
-        data = {
-            "firstName": first_name,
-            "lastName": last_name,
-            "email": email,
-            "phone": f"+1{dialed_number.strip()}",
-            "city": city,
-            "state": state,
-            "postalCode": zip_code,
-            "address1": f"{city}, {state} {zip_code}, {country}",
-            "customField": set_custom_fields(custom_fields_values, custom_fields),
-            "tags": set_tags(disposition, config.get('dispositionTagMapping', {})),
-        }
-
-        # Look up existing contact via external API.
-        contact = app_instance.contact_lookup(query)
-        note_data = (
-            f"Disposition: {disposition_translated}\n"
-            f"List ID: {list_id}\n"
-            f"Term Reason: {term_reason}\n"
-            f"Call Note: {call_note}"
-        )
 
+def validate_params(params):
+    """
+    Returns an error message when a required parameter is missing, otherwise None.
+    """
+    missing_params = [p for p in REQUIRED_PARAMS if not params.get(p)]
+    if missing_params:
+        return f"Missing required query parameters: {', '.join(missing_params)}"
+    return None
+
+
+def location_id_from_path(location_path):
+    """
+    Derives a simple location ID from the document path.
+    """
+    return location_path.split('/')[-1]
+
+
+def extract_lead(params):
+    """
+    Extracts and normalizes the Vici parameters of one lead into a dict used by
+    process_lead. params is any mapping with a .get method (request.args, a CSV row, ...).
+    Custom field parameters are not copied; set_custom_fields reads them from params
+    through the compiled mapping.
+    """
+    location_path = params.get('locationID')
+    # Ensure the document path is fully qualified (e.g., "configurations/{locationID}")
+    if "/" not in location_path:
+        location_path = f"configurations/{location_path}"
+
+    return {
+        "first_name": params.get('firstName'),
+        "last_name": params.get('lastName'),
+        "dialed_number": params.get('dialedNumber'),
+        "phone": normalize_phone(params.get('dialedNumber')),
+        "email": params.get('email'),
+        "city": params.get('city'),
+        "state": params.get('state'),
+        "zip_code": params.get('zip'),
+        "country": params.get('country'),
+        "disposition": params.get('disposition'),
+        "list_id": params.get('listID'),
+        "term_reason": params.get('termReason'),
+        "call_note": params.get('callNote'),
+        "location_path": location_path,
+        "params": params,
+    }
+
+
+def build_contact_data(lead, config, metadata):
+    """
+    Prepares the GHL contact payload, including custom fields and tags. Fields without a
+    value are left out (set_custom_fields skips empty custom fields too), so nothing
+    empty is sent and the payload is encoded as built.
+    """
+    disposition_translated = set_disposition_translated(lead['disposition'], config.get('dispositionMapping'))
+    data = {field: value for field, value in (
+        ("firstName", lead['first_name']),
+        ("lastName", lead['last_name']),
+        ("email", lead['email']),
+        ("phone", lead['phone']),
+        ("city", lead['city']),
+        ("state", lead['state']),
+        ("postalCode", lead['zip_code']),
+        ("address1", format_address(lead['city'], lead['state'], lead['zip_code'], lead['country'])),
+    ) if value}
+    custom_fields = set_custom_fields(lead['params'], metadata.fields_by_key, mapping_for(config),
+                                      disposition_translated)
+    if custom_fields:
+        data["customField"] = custom_fields
+    data["tags"] = set_tags(lead['disposition'], config.get('dispositionTagMapping'))
+    return data
+
+
+def disposition_fields(metadata):
+    """
+    Returns the fields of a contact payload that follow the disposition: the tags and the
+    disposition custom field. The write buffer always sends them, since another instance
+    may have set a different disposition since this one last wrote the contact.
+    """
+    return {"tags"} | {field['id'] for field in metadata.fields_by_key.get("disposition", ())}
+
+
+def format_address(city, state, zip_code, country):
+    """
+    Formats "City, ST 12345, Country" from the parts that are present ("" when none are).
+    """
+    region = " ".join(part for part in (state, zip_code) if part)
+    return ", ".join(part for part in (city, region, country) if part)
+
+
+def build_note(lead, config):
+    """
+    Builds the call note added to the contact for every disposition.
+    """
+    return (
+        f"Disposition: {set_disposition_translated(lead['disposition'], config.get('dispositionMapping'))}\n"
+        f"List ID: {lead['list_id']}\n"
+        f"Term Reason: {lead['term_reason']}\n"
+        f"Call Note: {lead['call_note']}"
+    )
+
+
+def build_opportunity(lead, contact_id, config, metadata, stage_name=None):
+    """
+    Returns (pipeline id, opportunity data) for a contact's opportunity in the configured
+    pipeline at stage_name (default: firstStageName), or None when the pipeline or stage
+    does not exist in the location.
+    """
+    my_stage = metadata.stage(config.get('pipelineName', 'Main Pipeline'),
+                              stage_name or config.get('firstStageName', 'New Lead'))
+    if my_stage == None:
+        return None
+    pipeline_id, stage_id = my_stage
+    opportunity_data = {
+        "status": "open",
+        "title": f"{lead['first_name']} {lead['last_name']}",
+        "stageId": stage_id,
+        "contactId": contact_id
+    }
+    return pipeline_id, opportunity_data
+
+
+def process_lead(app_instance, lead, config, metadata=None, write_window=None, add_note=True):
+    """
+    Runs the contact lookup, create/update, note and opportunity sequence for one lead
+    and returns the GHL contact id.
+    A phone already in the contact index is updated directly; the lookup only runs
+    for unknown phones or when GHL no longer has the indexed contact. Updates and notes
+    for existing contacts go through the write buffer (write_window overrides its flush window).
+    add_note=False skips the call note (used by backfills that only reconcile contacts).
+    When metadata is None it is taken from location_metadata, loading alongside the contact
+    index read and lookup. Once the contact is known to exist, the call note (or the
+    buffered update and note) and the opportunity sync run at the same time.
+    When the client's deadline runs short, or runs out during them, the note and
+    opportunity sync are deferred (see defer_follow_ups) and the contact id is still returned.
+    """
+    user_id = config.get('userID', '')
+    location_id = app_instance.location_id
+    phone = lead['phone']
+    created = False
+    deferred = []
+
+    metadata_load = None
+    if metadata is None:
+        if location_metadata.cached(location_id):
+            metadata = location_metadata.get(app_instance)
+        else:
+            metadata_load = lead_executor().submit(location_metadata.get, app_instance)
+
+    contact_id = contact_index.get(location_id, phone, timeout=app_instance.deadline.timeout(5))
+    # Look up existing contact via external API.
+    contact = app_instance.contact_lookup(f"phone={phone}") if contact_id is None else None
+    if metadata_load is not None:
+        metadata = metadata_load.result()
+
+    data = build_contact_data(lead, config, metadata)
+    note_data = build_note(lead, config) if add_note else None
+    if note_data and not runs_now(app_instance, 'note', deferred):
+        note_data = None
+    always = disposition_fields(metadata)
+    if contact_id is not None and not write_indexed_contact(app_instance, lead, contact_id, data, note_data,
+                                                            user_id, write_window, always):
+        contact_id = None
+        contact = app_instance.contact_lookup(f"phone={phone}")
+
+    # Calls that only need the contact to exist; they run concurrently.
+    calls = []
+    if contact_id is None:
         if not contact:
-            # Create new contact and add a note.
+            # Create new contact.
             contact_response = app_instance.create_contact(data)
             contact_id = contact_response["contact"]["id"]
+            created = True
             logging.info(f"Contact created: {contact_id}")
-            note_response = app_instance.add_notes(contact_id, note_data, user_id)
-            if note_response:
-                logging.info(f"Note created: {note_response.get('id')}")
-
-            pipelines=app_instance.get_pipelines()
-            my_pipeline = None
-            for pipeline in pipelines:
-                if pipeline['name'] == config.get('pipelineName', 'Main Pipeline'):
-                    my_pipeline = pipeline
-            if my_pipeline != None:
-                my_stage = None
-                for stage in my_pipeline['stages']:
-                    if stage['name'] == config.get('firstStageName','New Lead'):
-                        my_stage = stage
-                if my_stage != None:
-                    opportunity_data = {
-                        "status": "open",
-                        "title": f"{first_name} {last_name}",
-                        "stageId": my_stage['id'],
-                        "contactId": contact_id
-                    }
-                    my_opportunity_response = app_instance.create_opportunity(my_pipeline['id'], opportunity_data)
-                    if my_opportunity_response:
-                        logging.info(f"Opportunity Created: {my_opportunity_response['id']} {my_opportunity_response['name']}")
-            return jsonify({"contact_id": contact_id}), 200
+            contact_index.put(location_id, phone, contact_id, timeout=app_instance.deadline.grace(5))
+            contact_writes.remember(location_id, contact_id, data)
+            if note_data and runs_now(app_instance, 'note', deferred):
+                calls.append(deferrable('note', deferred,
+                                        lambda: log_note(app_instance.add_notes(contact_id, note_data, user_id))))
         else:
-            # Update existing contact and add a note.
+            # Update existing contact with the fields that differ from the lookup result.
             contact_id = contact['id']
-            contact_response = app_instance.update_contact(contact_id, data)
-            logging.info(f"Contact updated: {contact_id}")
-            note_response = app_instance.add_notes(contact_id, note_data, user_id)
-            if note_response:
-                logging.info(f"Note created: {note_response.get('id')}")
-            return jsonify({"contact_id": contact_id}), 200
-
-    except firestore.NotFound:
-        error_msg = "Firestore document not found or misconfigured."
-        logging.exception(error_msg)
-        return jsonify({"error": error_msg}), 404
+            contact_index.put(location_id, phone, contact_id, timeout=app_instance.deadline.grace(5))
+            contact_writes.remember(location_id, contact_id, contact_state(contact))
+            calls.append(lambda: log_note(contact_writes.write(app_instance, contact_id, data, note_data, user_id,
+                                                               write_window, always)))
+
+    opportunity_step = 'new_opportunity' if created else 'opportunity'
+    if needs_opportunity_sync(lead, config, created) and runs_now(app_instance, opportunity_step, deferred):
+        calls.append(deferrable(opportunity_step, deferred,
+                                lambda: sync_opportunity(app_instance, lead, contact_id, config, metadata, created)))
+    run_concurrently(calls)
+    if deferred:
+        defer_follow_ups(app_instance, lead, contact_id, deferred)
+    return contact_id
+
+
+def deferrable(step, deferred, call):
+    """
+    Wraps the call of a non-critical step (note, opportunity sync) so that running out of
+    request budget appends the step to deferred instead of failing the webhook.
+    """
+    def run():
+        try:
+            call()
+        except DeadlineExceededError:
+            logging.warning(f"Request deadline reached during {step}, deferring it")
+            deferred.append(step)
+    return run
+
+
+def lead_executor():
+    """
+    Returns the process-wide executor that overlaps independent calls of one lead.
+    Work submitted to it never waits on the executor itself, so a full pool only queues.
+    """
+    global _lead_executor
+    if _lead_executor is None:
+        with _lead_executor_lock:
+            if _lead_executor is None:
+                _lead_executor = ThreadPoolExecutor(max_workers=LEAD_CONCURRENCY, thread_name_prefix='lead')
+    return _lead_executor
+
+
+def run_concurrently(calls):
+    """
+    Runs the calls at the same time, the first on the current thread and the others on the
+    lead executor, and waits for all of them. The first error raised is re-raised.
+    """
+    if not calls:
+        return
+    futures = [lead_executor().submit(call) for call in calls[1:]]
+    error = None
+    try:
+        calls[0]()
     except Exception as e:
-        logging.exception("Unexpected error occurred.")
-        return jsonify({"error": str(e)}), 500
+        error = e
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
 
 
-def set_custom_fields(data, custom_fields):
+def needs_opportunity_sync(lead, config, created):
     """
-    Constructs the custom field dictionary based on provided values and definitions.
-    This helper function maps provided data to the expected custom field format.
+    True when sync_opportunity has something to do: the contact is new or its
+    disposition maps to a pipeline stage.
     """
-    result = {}
-    for field in custom_fields:
-        # Assumes fieldKey follows the format "prefix.fieldName"
+    return created or bool(set_opportunity_stage(lead['disposition'], config.get('dispositionStageMapping')))
+
+
+def runs_now(app_instance, step, deferred):
+    """
+    Returns True when a non-critical step (note, opportunity sync) should run inline.
+    With less than DEADLINE_DEFER_BELOW seconds left on the client's deadline the step
+    is appended to deferred instead, if follow-up jobs are enabled (a worker runs them).
+    """
+    if not jobs.FOLLOW_UP_JOBS or app_instance.deadline.allows(DEADLINE_DEFER_BELOW):
+        return True
+    deferred.append(step)
+    return False
+
+
+def defer_follow_ups(app_instance, lead, contact_id, steps):
+    """
+    Queues the deferred steps of a lead as a follow-up job when follow-up jobs are enabled;
+    vici_queue_worker runs them through run_follow_ups without a request deadline. Otherwise,
+    or when the job cannot be queued, the steps are logged with the job payload (it can be
+    replayed through vici_batch_to_ghl) rather than failing the webhook.
+    """
+    job = dict(jobs.compact_job(lead['params']), locationID=app_instance.location_id,
+               contactId=contact_id, followUp=",".join(steps))
+    if not jobs.FOLLOW_UP_JOBS:
+        logging.error(f"Request deadline short, {job['followUp']} not run for {contact_id}, "
+                      f"replay through vici_batch_to_ghl: {json.dumps(job)}")
+        return
+    try:
+        with tracing.span("queue.enqueue", endpoint=jobs.QUEUE_BACKEND):
+            job_id, _ = jobs.get_queue().enqueue(job, timeout=app_instance.deadline.grace(5))
+        logging.warning(f"Request deadline short, deferred {job['followUp']} for {contact_id}: job {job_id}")
+    except Exception:
+        logging.exception(f"Deferred {job['followUp']} for {contact_id} could not be queued: {json.dumps(job)}")
+
+
+def run_follow_ups(app_instance, lead, contact_id, config, metadata, steps):
+    """
+    Runs the steps deferred by process_lead for an existing contact.
+    """
+    for step in steps:
+        if step == 'note':
+            log_note(app_instance.add_notes(contact_id, build_note(lead, config), config.get('userID', '')))
+        elif step in ('opportunity', 'new_opportunity'):
+            sync_opportunity(app_instance, lead, contact_id, config, metadata, step == 'new_opportunity')
+        else:
+            logging.warning(f"Unknown follow-up step ignored: {step}")
+
+
+def sync_opportunity(app_instance, lead, contact_id, config, metadata, created):
+    """
+    Keeps the contact's opportunity in the configured pipeline current. A new contact gets
+    one at the stage its disposition maps to in dispositionStageMapping, or at firstStageName.
+    An existing contact's opportunity is only touched when the disposition maps to a stage:
+    it is moved there, or created there when the contact has none yet.
+    """
+    stage_name = set_opportunity_stage(lead['disposition'], config.get('dispositionStageMapping'))
+    if not created and not stage_name:
+        return
+    opportunity = build_opportunity(lead, contact_id, config, metadata, stage_name)
+    if opportunity == None:
+        logging.warning(f"Pipeline stage not found: {config.get('pipelineName', 'Main Pipeline')} / "
+                        f"{stage_name or config.get('firstStageName', 'New Lead')}")
+        return
+    pipeline_id, opportunity_data = opportunity
+    location_id = app_instance.location_id
+
+    entry = None if created else find_opportunity(app_instance, lead, contact_id, pipeline_id)
+    if entry is not None and entry['stageId'] != opportunity_data['stageId']:
         try:
-            custom_field = field['fieldKey'].split(".")[1]
-        except IndexError:
-            logging.warning(f"Invalid fieldKey format: {field.get('fieldKey')}")
-            continue
+            app_instance.update_opportunity(pipeline_id, entry['opportunityId'], {
+                "title": entry['title'] or opportunity_data['title'],
+                "status": entry['status'],
+                "stageId": opportunity_data['stageId'],
+            })
+            logging.info(f"Opportunity moved: {entry['opportunityId']} to {stage_name}")
+            opportunity_index.put(location_id, contact_id, dict(entry, stageId=opportunity_data['stageId']),
+                                  timeout=app_instance.deadline.grace(5))
+        except ApiError as e:
+            if e.status_code != 404:
+                raise
+            logging.info(f"Indexed opportunity not found, creating a new one: {entry['opportunityId']}")
+            opportunity_index.discard(location_id, contact_id, timeout=app_instance.deadline.grace(5))
+            entry = None
+    if entry is None:
+        my_opportunity_response = app_instance.create_opportunity(pipeline_id, opportunity_data)
+        log_opportunity(my_opportunity_response)
+        opportunity_index.put(location_id, contact_id, opportunity_entry(my_opportunity_response, pipeline_id),
+                              timeout=app_instance.deadline.grace(5))
 
-        if custom_field in data and data[custom_field]:
-            # Special handling for disposition field.
-            if custom_field == "disposition":
-                # Assuming 'is_disposition_set' is a method on GHL instance; adjust as needed.
-                current_disposition = field.get('currentValue')  # Replace with actual lookup if available.
-                if current_disposition and data[custom_field] == current_disposition.replace(".", ""):
-                    result[field['id']] = current_disposition + "."
-                else:
-                    result[field['id']] = data[custom_field]
-            else:
-                result[field['id']] = data[custom_field]
-    return result
 
-def set_tags(disposition, disposition_tag_mapping):
+def find_opportunity(app_instance, lead, contact_id, pipeline_id):
     """
-    Sets tags for the contact based on provided data.
-    This helper function maps provided data to the expected tag format.
-    If no tags are added, it defaults to "New Lead".
-    """
-    result = []
-    
-    if disposition:
-        for tag, values in disposition_tag_mapping.items():
-            if disposition in values:
-                result.append(tag)
-                break
+    Returns the opportunity index entry of an existing contact in the pipeline, or None.
+    On an index miss a single get_opportunities query by phone is made instead of
+    paging through the pipeline.
+    """
+    location_id = app_instance.location_id
+    entry = opportunity_index.get(location_id, contact_id, timeout=app_instance.deadline.timeout(5))
+    if entry is not None and entry['pipelineId'] == pipeline_id:
+        return entry
+    if not lead['phone']:
+        return None
+    for opportunity in app_instance.get_opportunities(pipeline_id, quote(lead['phone'])) or ():
+        if (opportunity.get('contact') or {}).get('id') == contact_id:
+            entry = opportunity_entry(opportunity, pipeline_id)
+            opportunity_index.put(location_id, contact_id, entry, timeout=app_instance.deadline.grace(5))
+            return entry
+    return None
 
-    # Add "New Lead" as a default tag if no tags were added
-    if not result:
-        result.append("New Lead")
 
-    return result
+def write_indexed_contact(app_instance, lead, contact_id, data, note_data, user_id, write_window=None, always=()):
+    """
+    Writes the update and note for a contact found in the contact index through the
+    write buffer. Returns False (and drops the index entry) when GHL answers 404 because
+    the contact was deleted or merged.
+    """
+    try:
+        note_response = contact_writes.write(app_instance, contact_id, data, note_data, user_id, write_window,
+                                             always)
+    except ApiError as e:
+        if e.status_code != 404:
+            raise
+        logging.info(f"Indexed contact not found, looking it up again: {contact_id}")
+        contact_index.discard(app_instance.location_id, lead['phone'], timeout=app_instance.deadline.grace(5))
+        return False
+    log_note(note_response)
+    return True
+
 
-def set_disposition_translated(disposition):
+def process_batch(rows, concurrency=batch.BATCH_CONCURRENCY, add_note=True):
     """
-    Translates the disposition for the contact based on provided data.
-    This helper function maps provided data to the expected disposition format.
-    """
-
-    dispositions_mapping = {
-        "DROP": "No Answer",
-        "ADC": "No Answer",
-        "PDROP": "Outbound Pre-Routing",
-        "A": "Answering Machine",
-        "AA": "Answering Machine Auto",
-        "AB": "Busy Auto",
-        "B": "Busy",
-        "CALLBK": "Call Back",
-        "CBL": "Call Back Later",
-        "DC": "Disconnected Number",
-        "DNC": "Do Not Call",
-        "Follow": "Follow Up",
-        "N": "No Answer",
-        "NAU": "No Answer",
-        "NA": "No Answer Autodial",
-        "NI": "Not Interested",
-        "NPRSN": "In Person Appointment",
-        "Nurtre": "Nurture",
-        "PHNAPT": "Phone Appointment",
-        "WN": "Wrong Number"
-    }
+    Processes many leads and yields one result dict per row as soon as it completes.
+    Configuration and field metadata are resolved once per location; rows are then
+    processed with at most `concurrency` in flight, and rows for the same phone number
+    run sequentially so they don't race to create duplicate contacts.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for location, phones in batch.group_rows(rows).items():
+            try:
+                location_path = location if "/" in location else f"configurations/{location}"
+                config = location_configs.get(location_path, timeout=10) if location else None
+                if config is None:
+                    raise LookupError(f"Configuration document not found: {location_path}")
+                app_instance = GHL(config.get('locationApiKey', ''), location_id_from_path(location_path))
+                metadata = location_metadata.get(app_instance)
+            except Exception as e:
+                status = 404 if isinstance(e, LookupError) else 500
+                for phone_rows in phones.values():
+                    for row_number, _ in phone_rows:
+                        yield {"row": row_number, "locationID": location, "status": status, "error": str(e)}
+                continue
+            for phone_rows in phones.values():
+                futures.append(executor.submit(_process_rows, app_instance, config, metadata, phone_rows, add_note))
 
-    result = ""
+        for future in as_completed(futures):
+            yield from future.result()
 
-    if disposition:
-        # Iterate through the mapping to find a match
-        for key, value in dispositions_mapping.items():
-            if disposition.upper().startswith(key.upper()):  # Case-insensitive match
-                result = value
-                break
 
+def _process_rows(app_instance, config, metadata, phone_rows, add_note=True):
+    results = []
+    for row_number, row in phone_rows:
+        result = {"row": row_number, "locationID": row.get('locationID')}
+        error_msg = validate_params(row)
+        if error_msg:
+            result.update(status=400, error=error_msg)
+        else:
+            try:
+                lead = extract_lead(row)
+                if row.get('followUp'):
+                    # Steps a webhook deferred for lack of time; the contact already exists.
+                    run_follow_ups(app_instance, lead, row['contactId'], config, metadata,
+                                   row['followUp'].split(','))
+                    result.update(status=200, contact_id=row['contactId'])
+                    results.append(result)
+                    continue
+                deadline = time.monotonic() + fanout.FANOUT_TIMEOUT
+                # Rows for one phone already run in order, so they don't wait for a flush window.
+                pending = start_targets(lead, config, write_window=0, add_note=add_note)
+                contact_id = process_lead(app_instance, lead, config, metadata, write_window=0, add_note=add_note)
+                result.update(status=200, contact_id=contact_id)
+                if pending:
+                    result.update(targets=fanout.collect(pending, deadline))
+            except Exception as e:
+                logging.exception(f"Batch row {row_number} failed.")
+                result.update(status=500, error=str(e))
+        results.append(result)
+    return results
+
+
+def log_note(note_response):
+    if note_response:
+        logging.info(f"Note created: {note_response.get('id')}")
+
+
+def log_opportunity(opportunity_response):
+    if opportunity_response:
+        logging.info(f"Opportunity Created: {opportunity_response['id']} {opportunity_response['name']}")
+
+
+def set_custom_fields(params, fields_by_key, mapping=DEFAULT_MAPPING, disposition_translated=None):
+    """
+    Constructs the custom field dictionary based on provided values and definitions.
+    Walks the compiled mapping once: reads each parameter, skips empty values and
+    template placeholders, and resolves the field ids through the LocationMetadata
+    index of fieldKey suffix to field definitions.
+    """
+    result = {}
+    # Special handling for disposition field.
+    if disposition_translated:
+        for field in fields_by_key.get("disposition", ()):
+            # Assuming 'is_disposition_set' is a method on GHL instance; adjust as needed.
+            current_disposition = field.get('currentValue')  # Replace with actual lookup if available.
+            if current_disposition and disposition_translated == current_disposition.replace(".", ""):
+                result[field['id']] = current_disposition + "."
+            else:
+                result[field['id']] = disposition_translated
+
+    for param, key, default in mapping:
+        fields = fields_by_key.get(key)
+        if not fields:
+            continue
+        value = params.get(param, default)
+        if not value or (value.startswith('--A--') and is_placeholder(value)):
+            continue
+        for field in fields:
+            result[field['id']] = value
     return result
 
-def clean_custom_fields_values(fields_dict):
+def set_tags(disposition, disposition_tag_mapping=None):
+    """
+    Sets tags for the contact based on provided data.
+    The location's dispositionTagMapping is compiled once into a status -> tag index.
+    If no tag matches, it defaults to "New Lead".
     """
-    Cleans a dictionary of custom field values by replacing any value of the form
-    '--A--field_name--B--' with an empty string.
+    return tag_index_for(disposition_tag_mapping).tags_for(disposition)
+
+def set_opportunity_stage(disposition, disposition_stage_mapping=None):
     """
-    cleaned = {}
-    pattern = re.compile(r'^--A--.*--B--$')
-    for k, v in fields_dict.items():
-        if isinstance(v, str) and pattern.match(v):
-            cleaned[k] = ""
-        else:
-            cleaned[k] = v
-    return cleaned
\ No newline at end of file
+    Returns the pipeline stage name the disposition maps to in the location's
+    dispositionStageMapping, or "" when the opportunity should stay where it is.
+    """
+    return stage_matcher_for(disposition_stage_mapping).translate(disposition)
+
+def set_disposition_translated(disposition, disposition_mapping=None):
+    """
+    Translates the disposition for the contact based on provided data.
+    Uses the longest matching status code of the default mapping, with the location's
+    dispositionMapping overrides applied.
+    """
+    return matcher_for(disposition_mapping).translate(disposition)
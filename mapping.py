@@ -0,0 +1,98 @@
+import re
+from functools import lru_cache
+
+# Vici sends "--A--field_name--B--" when a template field has no value.
+PLACEHOLDER_PATTERN = re.compile(r'^--A--.*--B--$')
+
+# Query parameter -> GHL custom field key (the part after "contact." in fieldKey), and the
+# default used when the parameter is missing. The disposition custom field is filled from
+# the translated disposition by set_custom_fields and is not listed here.
+CUSTOM_FIELD_SCHEMA = (
+    ('termReason', 'term_reason', None),
+    ('listID', 'list_id', None),
+    ('leadID', 'lead_id', '0'),
+    ('campaignID', 'campaign', None),
+    ('leadType', 'lead_type', ''),
+    ('agentAssigned', 'agent_assigned', ''),
+    ('altNumber', 'alt_number', ''),
+    ('homeValue', 'home_value', ''),
+    ('createDate', 'create_date', ''),
+    ('equity', 'equity', ''),
+    ('crmName', 'crm_name', ''),
+    ('contactLink', 'contact_link', ''),
+    ('buildDate', 'build_date', ''),
+    ('listingAgent', 'listing_agent', ''),
+    ('baths', 'baths', ''),
+    ('buyerAgent', 'buyer_agent', ''),
+    ('beds', 'beds', ''),
+    ('lotSize', 'lot_size', ''),
+    ('sqft', 'sqft', ''),
+    ('build', 'build', ''),
+    ('sqFt', 'sq_ft', ''),
+    ('county', 'county', ''),
+    ('zestimate', 'zestimate', ''),
+    ('lastSubmission', 'last_submission', ''),
+    ('tag', 'tag', ''),
+    ('leadScore', 'lead_score', ''),
+    ('lastSubmissionDate', 'last_submission_date', ''),
+    ('estimatedPrice', 'estimated_price', ''),
+    ('lastNumberDialed', 'last_number_dialed', ''),
+    ('daysOnMarket', 'days_on_market', ''),
+    ('finalQuestion', 'final_question', ''),
+    ('listingStatus', 'listing_status', ''),
+    ('teamMember', 'team_member', ''),
+    ('bathrooms', 'bathrooms', ''),
+    ('motivation', 'motivation', ''),
+    ('secondaryNumber', 'secondary_number', ''),
+    ('homeowner', 'homeowner', ''),
+    ('homeToSellOrBuy', 'home_to_sell_or_buy', ''),
+    ('areasOfInterest', 'areas_of_interest', ''),
+    ('pendingRepairs', 'pending_repairs', ''),
+    ('nonNegotiables', 'non_negotiables', ''),
+    ('timeframe', 'timeframe', ''),
+    ('bedrooms', 'bedrooms', ''),
+    ('lender', 'lender', ''),
+    ('recentUpgrades', 'recent_upgrades', ''),
+    ('callNote', 'notes', None),
+)
+
+
+def is_placeholder(value):
+    """
+    True for an unfilled Vici template value such as '--A--field_name--B--'.
+    """
+    return value.startswith('--A--') and PLACEHOLDER_PATTERN.match(value) is not None
+
+
+@lru_cache(maxsize=256)
+def compile_mapping(overrides=()):
+    """
+    Compiles the schema plus per-location overrides into a fixed table of
+    (query parameter, custom field key, default) tuples.
+    overrides is a sorted tuple of (query parameter, custom field key) pairs; an empty
+    key removes the parameter from the mapping. Results are cached, so each distinct
+    override set is compiled once per worker.
+    """
+    table = {param: (param, key, default) for param, key, default in CUSTOM_FIELD_SCHEMA}
+    for param, key in overrides:
+        if key:
+            default = table[param][2] if param in table else ''
+            table[param] = (param, key, default)
+        else:
+            table.pop(param, None)
+    return tuple(table.values())
+
+
+DEFAULT_MAPPING = compile_mapping()
+
+
+def mapping_for(config):
+    """
+    Returns the compiled mapping for a location. The Firestore configuration may define
+    'fieldMapping': {"queryParameter": "custom_field_key", ...} to add, remap or (with an
+    empty key) drop parameters.
+    """
+    overrides = config.get('fieldMapping')
+    if not overrides:
+        return DEFAULT_MAPPING
+    return compile_mapping(tuple(sorted((param, key or '') for param, key in overrides.items())))
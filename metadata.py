@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+import logging
+from cachetools import LRUCache
+from .deadline import NO_DEADLINE
+
+# Custom field and pipeline definitions are cached per location. After METADATA_TTL the
+# cached entry is still served while a background refresh runs; after METADATA_STALE_TTL
+# it is considered too old and the request reloads it inline.
+METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', '256'))
+METADATA_TTL = float(os.environ.get('METADATA_TTL', '600'))
+METADATA_STALE_TTL = float(os.environ.get('METADATA_STALE_TTL', '3600'))
+
+
+class LocationMetadata:
+    """
+    Custom field and pipeline definitions for one location, with lookup indexes:
+    fields_by_key maps the fieldKey suffix (e.g. "disposition" for "contact.disposition")
+    to the field definitions, and stages maps (pipeline name, stage name) to
+    (pipeline id, stage id).
+    """
+
+    def __init__(self, custom_fields, pipelines) -> None:
+        self.custom_fields = custom_fields or []
+        self.pipelines = pipelines or []
+        self.fetched_at = time.monotonic()
+
+        self.fields_by_key = {}
+        for field in self.custom_fields:
+            # Assumes fieldKey follows the format "prefix.fieldName"
+            try:
+                key = field['fieldKey'].split(".")[1]
+            except (KeyError, IndexError):
+                logging.warning(f"Invalid fieldKey format: {field.get('fieldKey')}")
+                continue
+            self.fields_by_key.setdefault(key, []).append(field)
+
+        self.stages = {}
+        for pipeline in self.pipelines:
+            for stage in pipeline.get('stages', []):
+                self.stages[(pipeline['name'], stage['name'])] = (pipeline['id'], stage['id'])
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def stage(self, pipeline_name, stage_name):
+        """
+        Returns (pipeline id, stage id) for the given names, or None when not found.
+        """
+        return self.stages.get((pipeline_name, stage_name))
+
+
+class MetadataCache:
+    """
+    Per-location cache of LocationMetadata with stale-while-revalidate refreshes.
+    """
+
+    def __init__(self, maxsize=METADATA_CACHE_SIZE, ttl=METADATA_TTL, stale_ttl=METADATA_STALE_TTL) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = LRUCache(maxsize=maxsize)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, app_instance):
+        """
+        Returns the LocationMetadata for the GHL client's location.
+        Only a missing or expired entry is loaded inline; an entry past its TTL is
+        returned as-is and refreshed in a background thread.
+        """
+        location_id = app_instance.location_id
+        with self._lock:
+            entry = self._entries.get(location_id)
+        if entry is None or entry.age() > self.stale_ttl:
+            return self._load(app_instance)
+        if entry.age() > self.ttl:
+            self._refresh_in_background(app_instance)
+        return entry
+
+    def cached(self, location_id):
+        """
+        True when get() answers from the cache for the location, without loading it inline.
+        """
+        with self._lock:
+            entry = self._entries.get(location_id)
+        return entry is not None and entry.age() <= self.stale_ttl
+
+    def invalidate(self, location_id=None):
+        """
+        Drops the cached metadata of one location, or of every location when location_id is None.
+        """
+        with self._lock:
+            if location_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(location_id, None)
+
+    def _load(self, app_instance):
+        entry = LocationMetadata(app_instance.get_custom_fields(), app_instance.get_pipelines())
+        with self._lock:
+            self._entries[app_instance.location_id] = entry
+        return entry
+
+    def _refresh_in_background(self, app_instance):
+        location_id = app_instance.location_id
+        # The refresh outlives the request, so it does not inherit the request's deadline.
+        app_instance = app_instance.with_deadline(NO_DEADLINE)
+        with self._lock:
+            if location_id in self._refreshing:
+                return
+            self._refreshing.add(location_id)
+
+        def refresh():
+            try:
+                self._load(app_instance)
+                logging.info(f"Metadata refreshed: {location_id}")
+            except Exception:
+                logging.exception(f"Metadata refresh failed, serving stale entry: {location_id}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(location_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+location_metadata = MetadataCache()
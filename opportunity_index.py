@@ -0,0 +1,33 @@
+import os
+from .keyed_index import KeyedIndex
+
+# Local index of (location, contact id) -> the contact's opportunity in the configured
+# pipeline, so stage changes don't have to search get_opportunities first.
+# OPPORTUNITY_INDEX_STORE=firestore also shares entries between instances through the
+# OPPORTUNITY_INDEX_COLLECTION collection.
+OPPORTUNITY_INDEX_SIZE = int(os.environ.get('OPPORTUNITY_INDEX_SIZE', '50000'))
+OPPORTUNITY_INDEX_STORE = os.environ.get('OPPORTUNITY_INDEX_STORE', '')
+OPPORTUNITY_INDEX_COLLECTION = os.environ.get('OPPORTUNITY_INDEX_COLLECTION', 'opportunityIndex')
+
+ENTRY_FIELDS = ('pipelineId', 'opportunityId', 'stageId', 'title', 'status')
+
+
+def opportunity_entry(opportunity, pipeline_id):
+    """
+    Builds an index entry from a GHL opportunity (as returned by create_opportunity,
+    update_opportunity or get_opportunities).
+    """
+    return {
+        "pipelineId": opportunity.get('pipelineId') or pipeline_id,
+        "opportunityId": opportunity['id'],
+        "stageId": opportunity.get('pipelineStageId') or opportunity.get('stageId'),
+        "title": opportunity.get('name') or opportunity.get('title'),
+        "status": opportunity.get('status') or 'open',
+    }
+
+
+opportunity_index = KeyedIndex(
+    'opportunity_index', OPPORTUNITY_INDEX_COLLECTION,
+    to_document=dict,
+    from_document=lambda snapshot: {field: snapshot.get(field) for field in ENTRY_FIELDS},
+    maxsize=OPPORTUNITY_INDEX_SIZE, store=OPPORTUNITY_INDEX_STORE)
@@ -0,0 +1,181 @@
+import os
+import time
+import random
+import threading
+from cachetools import LRUCache
+from .exceptions import ApiError, CircuitOpenError
+
+# GHL v1 allows 100 requests per 10 seconds per location. The bucket starts from these
+# defaults and is re-tuned from the X-RateLimit-* response headers when GHL sends them.
+RATE_LIMIT_MAX = int(os.environ.get('GHL_RATE_LIMIT_MAX', '100'))
+RATE_LIMIT_INTERVAL = float(os.environ.get('GHL_RATE_LIMIT_INTERVAL', '10'))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('GHL_RATE_LIMIT_MAX_WAIT', '30'))
+RETRY_MAX_ATTEMPTS = int(os.environ.get('GHL_RETRY_MAX_ATTEMPTS', '4'))
+RETRY_BASE_DELAY = float(os.environ.get('GHL_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.environ.get('GHL_RETRY_MAX_DELAY', '8'))
+BREAKER_FAILURES = int(os.environ.get('GHL_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.environ.get('GHL_BREAKER_RESET', '30'))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, capacity=None, interval=None) -> None:
+        capacity = capacity if capacity is not None else RATE_LIMIT_MAX
+        interval = interval if interval is not None else RATE_LIMIT_INTERVAL
+        self.capacity = float(capacity)
+        self.rate = capacity / interval
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """
+        Takes one token, sleeping as needed. Returns the time waited, or raises
+        ApiError(429) when the wait would exceed max_wait seconds.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            if waited + delay > max_wait:
+                raise ApiError(429, "Client-side rate limit wait exceeded, status code: {}")
+            time.sleep(delay)
+            waited += delay
+
+    def update_from_headers(self, headers):
+        """
+        Re-tunes the bucket from GHL rate-limit headers when present:
+        X-RateLimit-Max / X-RateLimit-Interval-Milliseconds set the rate and
+        X-RateLimit-Remaining caps the tokens currently available.
+        """
+        limit = headers.get('X-RateLimit-Max')
+        interval_ms = headers.get('X-RateLimit-Interval-Milliseconds')
+        remaining = headers.get('X-RateLimit-Remaining')
+        with self._lock:
+            try:
+                if limit and interval_ms and float(interval_ms) > 0:
+                    self.capacity = float(limit)
+                    self.rate = float(limit) / (float(interval_ms) / 1000)
+                if remaining is not None:
+                    self._refill(time.monotonic())
+                    self.tokens = min(self.tokens, float(remaining))
+            except ValueError:
+                pass
+
+    def drain(self, seconds):
+        """
+        Empties the bucket so no request is sent for roughly `seconds` (after a 429).
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate + 1)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive server-side failures and rejects calls until
+    `reset_timeout` has passed, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET) -> None:
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self, location_id):
+        """
+        Raises CircuitOpenError while the circuit is open. Returns True when this call is
+        the half-open trial; its outcome must be recorded, or the trial released.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                raise CircuitOpenError(location_id)
+            self.trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """
+        Gives up a half-open trial that ended without reaching GHL (e.g. the client-side
+        rate limit gave up), so the next call can be the trial.
+        """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+
+
+class LocationLimiter:
+    """
+    Rate limiter and circuit breaker shared by every GHL client of one location.
+    """
+
+    def __init__(self) -> None:
+        self.bucket = TokenBucket()
+        self.breaker = CircuitBreaker()
+
+
+_limiters = LRUCache(maxsize=1024)
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(location_id):
+    """
+    Returns the process-wide LocationLimiter for a location.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(location_id)
+        if limiter is None:
+            limiter = _limiters[location_id] = LocationLimiter()
+        return limiter
+
+
+def reset():
+    """
+    Drops every location's limiter and breaker, e.g. after changing RATE_LIMIT_MAX.
+    """
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff for the given retry attempt (1-based).
+    A Retry-After header value, when present, is used as the lower bound.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), RETRY_MAX_DELAY))
+        except ValueError:
+            pass
+    return delay
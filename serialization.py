@@ -0,0 +1,57 @@
+import os
+import json
+import logging
+
+# JSON encoding of GHL request payloads and decoding of responses. With JSON_BACKEND=auto
+# (default) orjson is used when it is installed and the standard library otherwise;
+# "json" forces the standard library. Payloads are built without empty values (see
+# main.build_contact_data) and encoded as they are, without a second pass.
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _stdlib_dumps(obj):
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def _select_backend(name):
+    """
+    Returns (backend name, dumps, loads) for a JSON_BACKEND setting. dumps returns UTF-8 bytes.
+    """
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return 'orjson', orjson.dumps, orjson.loads
+        except ImportError:
+            if name == 'orjson':
+                logging.warning("JSON_BACKEND is orjson but orjson is not installed, using json")
+    return 'json', _stdlib_dumps, json.loads
+
+
+backend, _dumps, _loads = _select_backend(JSON_BACKEND)
+
+
+def configure(name):
+    """
+    Switches the JSON backend at runtime, e.g. configure("json") in benchmarks.
+    """
+    global backend, _dumps, _loads
+    backend, _dumps, _loads = _select_backend(name)
+    return backend
+
+
+def dumps(data):
+    """
+    Encodes a request payload to JSON bytes.
+    """
+    return _dumps(data)
+
+
+def loads(content):
+    """
+    Decodes a response body; an empty body decodes to {}.
+    """
+    if not content:
+        return {}
+    return _loads(content)
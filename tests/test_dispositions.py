@@ -0,0 +1,77 @@
+"""
+Conformance of the compiled disposition and tag matchers: every Vicidial system status plus
+the custom statuses used by our campaigns (and lower-case and suffixed variants) against a
+brute-force longest-prefix reference and the previous linear tag scan.
+"""
+import pytest
+from ..main import set_disposition_translated, set_tags
+from ..dispositions import DEFAULT_DISPOSITIONS
+from ..benchmarks.disposition_tables import VICI_STATUSES, TAG_MAPPING, legacy_tags
+
+# Statuses that also start with a shorter code, and the label of their longest code. The
+# previous insertion-order scan already got ADC and NAU right (they are listed before "A"
+# and "N"); bench_dispositions.py prints the ones whose label changed.
+EXPECTED = {
+    'AA': 'Answering Machine Auto',
+    'AB': 'Busy Auto',
+    'ADC': 'No Answer',
+    'NA': 'No Answer Autodial',
+    'NAU': 'No Answer',
+    'NI': 'Not Interested',
+    'NPRSN': 'In Person Appointment',
+    'Nurtre': 'Nurture',
+    'nurtre': 'Nurture',
+    'NANQUE': 'No Answer Autodial',
+}
+
+OVERRIDES = {"SALE": "Sale", "nI": "Not Interested - Do Not Recontact", "N": ""}
+
+
+def reference_translate(disposition, mapping=DEFAULT_DISPOSITIONS):
+    """
+    Brute-force longest-prefix match, case-insensitive.
+    """
+    if not disposition:
+        return ""
+    matches = [code for code in mapping if disposition.upper().startswith(code.upper())]
+    return mapping[max(matches, key=len)] if matches else ""
+
+
+def variants(status):
+    return (status, status.lower(), status + 'X', status.lower() + '9')
+
+
+def merged_overrides():
+    merged = {code.upper(): label for code, label in DEFAULT_DISPOSITIONS.items()}
+    merged.update({"SALE": "Sale", "NI": "Not Interested - Do Not Recontact"})
+    del merged["N"]
+    return merged
+
+
+ALL_VARIANTS = [disposition for status in VICI_STATUSES for disposition in variants(status)]
+
+
+@pytest.mark.parametrize('disposition', ALL_VARIANTS)
+def test_translate_matches_longest_prefix(disposition):
+    assert set_disposition_translated(disposition) == reference_translate(disposition)
+
+
+@pytest.mark.parametrize('disposition', ALL_VARIANTS)
+def test_translate_with_overrides(disposition):
+    assert set_disposition_translated(disposition, OVERRIDES) == reference_translate(disposition, merged_overrides())
+
+
+@pytest.mark.parametrize('status', VICI_STATUSES)
+def test_tags_match_linear_scan(status):
+    assert set_tags(status, TAG_MAPPING) == legacy_tags(status, TAG_MAPPING)
+
+
+@pytest.mark.parametrize('disposition, label', EXPECTED.items())
+def test_longer_codes_win(disposition, label):
+    assert set_disposition_translated(disposition) == label
+
+
+@pytest.mark.parametrize('disposition', ['', None])
+def test_empty_disposition(disposition):
+    assert set_disposition_translated(disposition) == ""
+    assert set_tags(disposition, TAG_MAPPING) == ["New Lead"]
@@ -0,0 +1,208 @@
+"""
+Rate limiting, retries and the circuit breaker of apps.GHL, against benchmarks/fake_ghl.py.
+"""
+import time
+import socket
+import threading
+import pytest
+import requests
+from .. import ratelimit
+from ..apps import GHL
+from ..deadline import Deadline
+from ..exceptions import ApiError, CircuitOpenError, DeadlineExceededError
+from ..ratelimit import TokenBucket
+from ..benchmarks.fake_ghl import FakeGHLServer
+
+
+class CountingSession(requests.Session):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sent = 0
+
+    def request(self, *args, **kwargs):
+        self.sent += 1
+        return super().request(*args, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'RETRY_BASE_DELAY', 0.01)
+    monkeypatch.setattr(ratelimit, 'RETRY_MAX_DELAY', 0.05)
+    ratelimit.reset()
+    yield
+    ratelimit.reset()
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(**options):
+        servers.append(FakeGHLServer(**options).start())
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def client_for(server, location_id='location1', api_key='key-location1', **options):
+    return GHL(api_key, location_id, session=CountingSession(), base_url=server.base_url, **options)
+
+
+def sent(server, method, route):
+    return server.state.requests[(method, route)]
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=2, interval=0.2)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert 0.05 <= bucket.acquire() <= 0.2
+    with pytest.raises(ApiError) as error:
+        bucket.acquire(max_wait=0.01)
+    assert error.value.status_code == 429
+
+
+def test_token_bucket_follows_rate_limit_headers():
+    bucket = TokenBucket(capacity=100, interval=10)
+    bucket.update_from_headers({'X-RateLimit-Max': '5', 'X-RateLimit-Interval-Milliseconds': '1000',
+                                'X-RateLimit-Remaining': '0'})
+    assert (bucket.capacity, bucket.rate) == (5, 5)
+    with pytest.raises(ApiError):
+        bucket.acquire(max_wait=0.1)
+    bucket.update_from_headers({'X-RateLimit-Max': 'n/a', 'X-RateLimit-Interval-Milliseconds': '1000'})
+    assert bucket.capacity == 5
+
+
+def test_client_paces_itself_from_rate_limit_headers(start_server):
+    server = start_server(rate_limit=2, rate_interval=0.3)
+    client = client_for(server)
+    started = time.monotonic()
+    for _ in range(4):
+        client.create_contact({"phone": "+15551234567"})
+    # The bucket is retuned to two creates per 0.3s, so the later creates wait rather than
+    # each burning a 429 round trip.
+    assert time.monotonic() - started >= 0.25
+    assert len(server.state.contacts) == 4
+    assert sent(server, 'POST', 'contacts') < 6
+
+
+def test_create_is_retried_after_429(start_server):
+    server = start_server(rate_limit=1, rate_interval=0.2)
+    client_for(server, 'location1').create_contact({"phone": "+15551234567"})
+    # Same API key, another location: its own bucket is full, so GHL answers 429 first.
+    client_for(server, 'location2').create_contact({"phone": "+15551234568"})
+    assert sent(server, 'POST', 'contacts') == 3
+    assert len(server.state.contacts) == 2
+
+
+def test_idempotent_call_is_retried_on_server_error(start_server):
+    server = start_server(error_rate=1.0)
+    with pytest.raises(ApiError) as error:
+        client_for(server).get_custom_fields()
+    assert error.value.status_code == 503
+    assert sent(server, 'GET', 'custom-fields') == ratelimit.RETRY_MAX_ATTEMPTS
+
+
+def test_create_is_not_retried_on_server_error(start_server):
+    server = start_server(error_rate=1.0)
+    with pytest.raises(ApiError):
+        client_for(server).create_contact({"phone": "+15551234567"})
+    assert sent(server, 'POST', 'contacts') == 1
+
+
+def test_create_is_not_retried_after_read_timeout(start_server):
+    server = start_server(latency_ms=(300, 300))
+    client = client_for(server, timeout=(1, 0.1))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.create_contact({"phone": "+15551234567"})
+    time.sleep(0.4)
+    assert client.session.sent == 1
+    assert sent(server, 'POST', 'contacts') == 1
+
+
+def test_create_is_retried_when_connection_refused():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = GHL('key-location1', 'location1', session=CountingSession(), base_url=f"http://127.0.0.1:{port}/v1")
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.create_contact({"phone": "+15551234567"})
+    assert client.session.sent == ratelimit.RETRY_MAX_ATTEMPTS
+
+
+def test_breaker_opens_and_lets_one_trial_through(start_server, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'RETRY_MAX_ATTEMPTS', 1)
+    server = start_server(error_rate=1.0)
+    client = client_for(server)
+    breaker = client.limiter.breaker
+    breaker.failures, breaker.reset_timeout = 2, 0.2
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            client.get_custom_fields()
+    with pytest.raises(CircuitOpenError):
+        client.get_custom_fields()
+    assert sent(server, 'GET', 'custom-fields') == 2
+
+    # Half-open: a single trial goes through, concurrent calls are still rejected.
+    time.sleep(0.25)
+    server.latency_ms = (200, 200)
+    trial = threading.Thread(target=lambda: pytest.raises(ApiError, client.get_custom_fields))
+    trial.start()
+    time.sleep(0.05)
+    with pytest.raises(CircuitOpenError):
+        client.get_custom_fields()
+    trial.join()
+    # The failed trial opens the circuit again.
+    with pytest.raises(CircuitOpenError):
+        client.get_custom_fields()
+
+    time.sleep(0.25)
+    server.latency_ms, server.error_rate = (0, 0), 0.0
+    assert client.get_custom_fields()
+    assert client.get_custom_fields()
+    assert sent(server, 'GET', 'custom-fields') == 5
+
+
+def test_trial_that_never_reached_ghl_is_released(start_server, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'RETRY_MAX_ATTEMPTS', 1)
+    server = start_server(error_rate=1.0)
+    client = client_for(server)
+    breaker = client.limiter.breaker
+    breaker.failures, breaker.reset_timeout = 1, 0.1
+    with pytest.raises(ApiError):
+        client.get_custom_fields()
+    time.sleep(0.15)
+
+    # The trial gives up on the client-side rate limit before sending anything.
+    monkeypatch.setattr(ratelimit, 'RATE_LIMIT_MAX_WAIT', 0)
+    client.limiter.bucket.drain(10)
+    with pytest.raises(ApiError) as error:
+        client.get_custom_fields()
+    assert error.value.status_code == 429 and not isinstance(error.value, CircuitOpenError)
+
+    client.limiter.bucket = TokenBucket()
+    server.error_rate = 0.0
+    assert client.get_custom_fields()
+
+
+def test_backoff_that_does_not_fit_the_deadline_is_skipped(start_server, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'backoff_delay', lambda attempt, retry_after=None: 2.0)
+    server = start_server(error_rate=1.0)
+    client = client_for(server, deadline=Deadline(1.0))
+    started = time.monotonic()
+    with pytest.raises(ApiError) as error:
+        client.get_custom_fields()
+    assert error.value.status_code == 503
+    assert time.monotonic() - started < 0.5
+    assert sent(server, 'GET', 'custom-fields') == 1
+
+
+def test_slow_call_is_cut_by_the_deadline(start_server):
+    server = start_server(latency_ms=(1500, 1500))
+    client = client_for(server, deadline=Deadline(1.0))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        client.get_custom_fields()
+    assert time.monotonic() - started < 1.3
@@ -0,0 +1,146 @@
+"""
+Duplicate suppression: in-flight coalescing, the bucket boundary, failures, and the shared
+Firestore records (two Idempotency objects over one FakeFirestore stand for two instances).
+"""
+import time
+import threading
+import pytest
+from ..idempotency import Idempotency, idempotency_key
+from ..benchmarks.fake_firestore import FakeFirestore
+
+LEAD = {"location_path": "configurations/location1", "params": {"leadID": "7"}, "phone": "+15551234567",
+        "disposition": "NI"}
+
+
+def key_at(now, window=0.2, **overrides):
+    return idempotency_key(dict(LEAD, **overrides), window=window, now=now)
+
+
+class Counter:
+
+    def __init__(self, result="ok", error=None, release=None) -> None:
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.release = release
+
+    def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(1)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_key_depends_on_lead_disposition_and_bucket():
+    assert key_at(10.05) == key_at(10.15)
+    assert key_at(10.05) != key_at(10.25)
+    assert key_at(10.05) != key_at(10.05, disposition="SALE")
+    assert key_at(10.05, params={"leadID": "0"}) == key_at(10.05, params={})
+    assert key_at(10.05, params={"leadID": "0"}) != key_at(10.05)
+
+
+def test_concurrent_duplicates_share_one_run():
+    idempotency = Idempotency(window=0.2)
+    fn = Counter(release=threading.Event())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(idempotency.run(key_at(10.05), fn)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    fn.release.set()
+    for thread in threads:
+        thread.join()
+    assert fn.calls == 1
+    assert sorted(results) == [("ok", False), ("ok", True), ("ok", True)]
+
+
+def test_later_duplicate_gets_stored_result():
+    idempotency = Idempotency(window=0.2)
+    fn = Counter()
+    assert idempotency.run(key_at(10.05), fn) == ("ok", False)
+    assert idempotency.run(key_at(10.15), fn) == ("ok", True)
+    assert idempotency.run(key_at(10.05, disposition="SALE"), fn) == ("ok", False)
+    assert fn.calls == 2
+
+
+def test_duplicate_across_bucket_boundary_within_window():
+    idempotency = Idempotency(window=0.2)
+    fn = Counter()
+    idempotency.run(key_at(10.19), fn)
+    time.sleep(0.05)
+    assert idempotency.run(key_at(10.21), fn) == ("ok", True)
+    assert fn.calls == 1
+
+
+def test_previous_bucket_older_than_window_is_not_a_duplicate():
+    idempotency = Idempotency(window=0.2)
+    fn = Counter()
+    idempotency.run(key_at(10.01), fn)
+    time.sleep(0.25)
+    assert idempotency.run(key_at(10.39), fn) == ("ok", False)
+    assert fn.calls == 2
+
+
+@pytest.mark.parametrize('fn', [Counter(error=RuntimeError("GHL down")), Counter(result=None)])
+def test_failures_are_not_remembered(fn):
+    idempotency = Idempotency(window=0.2)
+    for _ in range(2):
+        if fn.error is not None:
+            with pytest.raises(RuntimeError):
+                idempotency.run(key_at(10.05), fn)
+        else:
+            assert idempotency.run(key_at(10.05), fn) == (None, False)
+    assert fn.calls == 2
+
+
+def test_concurrent_duplicate_gets_the_failure():
+    idempotency = Idempotency(window=0.2)
+    fn = Counter(error=RuntimeError("GHL down"), release=threading.Event())
+    errors = []
+
+    def run():
+        try:
+            idempotency.run(key_at(10.05), fn)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    fn.release.set()
+    for thread in threads:
+        thread.join()
+    assert fn.calls == 1 and len(errors) == 2
+
+
+def test_shared_records_suppress_duplicates_on_other_instances():
+    client = FakeFirestore()
+    first, second = (Idempotency(window=0.2, store='firestore', client_factory=lambda: client) for _ in range(2))
+    fn = Counter()
+    assert first.run(key_at(10.05), fn) == ("ok", False)
+    assert second.run(key_at(10.15), fn) == ("ok", True)
+    assert second.run(key_at(10.21), fn) == ("ok", True)
+    assert fn.calls == 1
+
+
+def test_shared_record_of_previous_bucket_expires_after_window():
+    client = FakeFirestore()
+    first, second = (Idempotency(window=0.2, store='firestore', client_factory=lambda: client) for _ in range(2))
+    fn = Counter()
+    first.run(key_at(10.01), fn)
+    time.sleep(0.25)
+    assert second.run(key_at(10.39), fn) == ("ok", False)
+    assert fn.calls == 2
+
+
+def test_failed_run_releases_shared_record():
+    client = FakeFirestore()
+    first, second = (Idempotency(window=0.2, store='firestore', client_factory=lambda: client) for _ in range(2))
+    with pytest.raises(RuntimeError):
+        first.run(key_at(10.05), Counter(error=RuntimeError("GHL down")))
+    assert client.documents == {}
+    assert second.run(key_at(10.05), Counter()) == ("ok", False)
@@ -0,0 +1,92 @@
+"""
+The SQLite job queue (the local stand-in for the Firestore backend): enqueue dedupe,
+claim and lease, retry delay and dead-lettering.
+"""
+import time
+import pytest
+from .. import jobs
+from ..jobs import SQLiteJobQueue, dedupe_key
+
+
+def job(**overrides):
+    return dict({"firstName": "A", "lastName": "B", "dialedNumber": "(555) 123-4567", "locationID": "location1",
+                 "leadID": "7", "disposition": "NI"}, **overrides)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(path=str(tmp_path / "jobs.db"), max_attempts=3, lease_seconds=0.2, dedupe_seconds=0.2)
+
+
+def test_duplicate_is_collapsed(queue):
+    job_id, duplicate = queue.enqueue(job())
+    assert not duplicate
+    assert queue.enqueue(job(firstName="Other")) == (job_id, True)
+    assert not queue.enqueue(job(disposition="SALE"))[1]
+    assert not queue.enqueue(job(leadID="8"))[1]
+    assert not queue.enqueue(job(followUp="note", contactId="contact1"))[1]
+
+
+def test_dedupe_key_falls_back_to_phone():
+    assert dedupe_key(job(leadID="0")) == dedupe_key(job(leadID="", dialedNumber="+15551234567"))
+    assert dedupe_key(job(leadID="0")) != dedupe_key(job(leadID="0", dialedNumber="5559999999"))
+
+
+def test_pending_job_stays_duplicate_after_window(queue):
+    job_id, _ = queue.enqueue(job())
+    time.sleep(0.25)
+    assert queue.enqueue(job()) == (job_id, True)
+    [(claimed_id, _)] = queue.claim()
+    assert claimed_id == job_id
+    assert queue.enqueue(job()) == (job_id, True)
+
+
+def test_finished_job_frees_key_after_window(queue):
+    job_id, _ = queue.enqueue(job())
+    [(claimed_id, _)] = queue.claim()
+    queue.complete(claimed_id)
+    assert queue.enqueue(job()) == (job_id, True)
+    time.sleep(0.25)
+    new_id, duplicate = queue.enqueue(job())
+    assert not duplicate and new_id != job_id
+    assert [claimed for claimed, _ in queue.claim()] == [new_id]
+
+
+def test_claim_leases_jobs(queue):
+    first, _ = queue.enqueue(job())
+    second, _ = queue.enqueue(job(leadID="8"))
+    assert queue.claim(limit=1) == [(first, job())]
+    assert [claimed for claimed, _ in queue.claim()] == [second]
+    assert queue.claim() == []
+    # An expired lease (the worker died) makes the job claimable again.
+    time.sleep(0.25)
+    assert [claimed for claimed, _ in queue.claim()] == [first, second]
+
+
+def test_failed_job_is_retried_after_delay(queue, monkeypatch):
+    monkeypatch.setattr(jobs, 'QUEUE_RETRY_DELAY', 0.1)
+    job_id, _ = queue.enqueue(job())
+    queue.claim()
+    queue.fail(job_id, "GHL returned 503")
+    assert queue.claim() == []
+    time.sleep(0.15)
+    assert queue.claim() == [(job_id, job())]
+    # The delay grows with the number of attempts.
+    queue.fail(job_id, "GHL returned 503")
+    time.sleep(0.15)
+    assert queue.claim() == []
+    time.sleep(0.1)
+    assert queue.claim() == [(job_id, job())]
+
+
+def test_job_is_dead_lettered_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(jobs, 'QUEUE_RETRY_DELAY', 0)
+    job_id, _ = queue.enqueue(job())
+    for attempt in range(3):
+        assert queue.claim() == [(job_id, job())]
+        queue.fail(job_id, f"failure {attempt + 1}")
+    assert queue.claim() == []
+    assert queue.dead_letters() == [{"id": job_id, "job": job(), "error": "failure 3", "attempts": 3}]
+    # A dead job outside the dedupe window no longer blocks a new one.
+    time.sleep(0.25)
+    assert not queue.enqueue(job())[1]
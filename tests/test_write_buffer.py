@@ -0,0 +1,118 @@
+"""
+The contact write buffer: merging of writes inside the flush window, the diff against the
+last-known contact state, and error propagation to every merged caller.
+"""
+import time
+import threading
+import pytest
+from ..exceptions import ApiError
+from ..write_buffer import ContactWriteBuffer, NOTE_SEPARATOR, contact_state
+
+
+class RecordingClient:
+    """
+    Stands in for apps.GHL: records update_contact and add_notes calls.
+    """
+    location_id = 'location1'
+
+    def __init__(self, update_error=None) -> None:
+        self.updates = []
+        self.notes = []
+        self.update_error = update_error
+
+    def update_contact(self, contact_id, data):
+        if self.update_error is not None:
+            raise self.update_error
+        self.updates.append((contact_id, data))
+        return {"contact": {"id": contact_id}}
+
+    def add_notes(self, contact_id, notes, user_id):
+        self.notes.append((contact_id, notes, user_id))
+        return {"id": f"note{len(self.notes)}"}
+
+
+def write_concurrently(buffer, client, writes, stagger=0.02):
+    """
+    Starts one writer per (data, note) shortly after each other and returns their results.
+    """
+    results = [None] * len(writes)
+
+    def write(i, data, note):
+        try:
+            results[i] = buffer.write(client, 'contact1', data, note, 'user1')
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=write, args=(i, data, note)) for i, (data, note) in enumerate(writes)]
+    for thread in threads:
+        thread.start()
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_writes_in_window_are_merged():
+    buffer = ContactWriteBuffer(window=0.2)
+    client = RecordingClient()
+    results = write_concurrently(buffer, client, [
+        ({"city": "Austin", "tags": ["Callback"], "customField": {"f1": "a", "f2": "b"}}, "first"),
+        ({"city": "Dallas", "customField": {"f2": "c"}}, "second"),
+    ])
+    assert client.updates == [("contact1", {"city": "Dallas", "tags": ["Callback"],
+                                            "customField": {"f1": "a", "f2": "c"}})]
+    assert client.notes == [("contact1", "first" + NOTE_SEPARATOR + "second", "user1")]
+    assert results == [{"id": "note1"}, {"id": "note1"}]
+
+
+def test_unchanged_fields_are_not_sent():
+    buffer = ContactWriteBuffer(window=0)
+    client = RecordingClient()
+    buffer.remember('location1', 'contact1', {"city": "Austin", "customField": {"f1": "a"}})
+    buffer.write(client, 'contact1', {"city": "Austin", "state": "TX", "customField": {"f1": "a", "f2": "b"}},
+                 None, 'user1')
+    assert client.updates == [("contact1", {"state": "TX", "customField": {"f2": "b"}})]
+    buffer.write(client, 'contact1', {"city": "Austin", "state": "TX"}, "note", 'user1')
+    assert len(client.updates) == 1
+    assert client.notes == [("contact1", "note", "user1")]
+
+
+def test_empty_values_are_not_sent():
+    buffer = ContactWriteBuffer(window=0)
+    client = RecordingClient()
+    buffer.write(client, 'contact1', {"email": "", "city": None, "tags": [], "customField": {"f1": ""}}, None, 'user1')
+    assert client.updates == []
+
+
+def test_always_fields_are_sent_when_unchanged():
+    buffer = ContactWriteBuffer(window=0)
+    client = RecordingClient()
+    buffer.remember('location1', 'contact1', contact_state({
+        "id": "contact1", "city": "Austin", "tags": ["Callback"],
+        "customField": [{"id": "disposition", "value": "Call Back"}, {"id": "f1", "value": "a"}],
+    }))
+    buffer.write(client, 'contact1', {"city": "Austin", "tags": ["Callback"],
+                                      "customField": {"disposition": "Call Back", "f1": "a"}},
+                 None, 'user1', always={"tags", "disposition"})
+    assert client.updates == [("contact1", {"tags": ["Callback"], "customField": {"disposition": "Call Back"}})]
+
+
+def test_update_error_reaches_every_merged_caller():
+    buffer = ContactWriteBuffer(window=0.2)
+    client = RecordingClient(update_error=ApiError(404))
+    buffer.remember('location1', 'contact1', {"city": "Austin"})
+    results = write_concurrently(buffer, client, [({"city": "Dallas"}, "first"), ({"state": "TX"}, "second")])
+    assert all(isinstance(result, ApiError) and result.status_code == 404 for result in results)
+    assert client.notes == []
+    # The known state is dropped, so the next write sends every field again.
+    client.update_error = None
+    buffer.write(client, 'contact1', {"city": "Austin"}, None, 'user1')
+    assert client.updates == [("contact1", {"city": "Austin"})]
+
+
+@pytest.mark.parametrize('window', [0, 0.05])
+def test_single_write_returns_note_response(window):
+    buffer = ContactWriteBuffer(window=window)
+    client = RecordingClient()
+    assert buffer.write(client, 'contact1', {"city": "Austin"}, "note", 'user1') == {"id": "note1"}
+    assert buffer.write(client, 'contact1', {"city": "Austin"}, None, 'user1') is None
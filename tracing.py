@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import bisect
+import functools
+import logging
+import threading
+import uuid
+
+# Comma separated list of exporters: "log" (structured JSON lines on stdout, parsed by
+# Cloud Logging), "otel" (OpenTelemetry spans, needs opentelemetry-api installed) and
+# "metrics" (in-process Prometheus-style histograms). Empty (the default) turns tracing
+# into a no-op.
+TRACE_EXPORTERS = os.environ.get('TRACE_EXPORTERS', '')
+# Every HTTP entry point answers GET requests for METRICS_PATH with the metrics of the
+# instance that serves it (span histograms and connection reuse counters); empty disables it.
+METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_exporters = frozenset()
+_tracer = None
+_trace_logger = logging.getLogger('vici_to_ghl.trace')
+_metrics = {}
+_metrics_lock = threading.Lock()
+# Distinguishes the series of each function instance behind one URL.
+_instance = uuid.uuid4().hex[:12]
+
+
+def configure(exporters):
+    """
+    Selects the active exporters, e.g. configure("log,metrics"). Unknown names are ignored.
+    """
+    global _exporters, _tracer
+    names = frozenset(name.strip() for name in exporters.split(',') if name.strip())
+    if 'otel' in names:
+        try:
+            from opentelemetry import trace
+            _tracer = trace.get_tracer('vici_to_ghl')
+        except ImportError:
+            logging.warning("TRACE_EXPORTERS includes otel but opentelemetry is not installed")
+            names = names - {'otel'}
+    if 'log' in names and not _trace_logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _trace_logger.addHandler(handler)
+        _trace_logger.setLevel(logging.INFO)
+        _trace_logger.propagate = False
+    _exporters = names
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    Times a block and reports it, with its attributes, to the active exporters on exit.
+    """
+    __slots__ = ('name', 'attrs', 'start', '_otel_context', '_otel_span')
+
+    def __init__(self, name, attrs) -> None:
+        self.name = name
+        self.attrs = attrs
+        self._otel_context = None
+        self._otel_span = None
+
+    def __enter__(self):
+        if _tracer is not None and 'otel' in _exporters:
+            self._otel_context = _tracer.start_as_current_span(self.name)
+            self._otel_span = self._otel_context.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        if 'log' in _exporters:
+            _trace_logger.info(json.dumps({
+                "severity": "ERROR" if exc_type is not None else "INFO",
+                "message": f"{self.name} {duration_ms:.1f}ms",
+                "span": self.name,
+                "duration_ms": round(duration_ms, 2),
+                **self.attrs,
+            }, default=str))
+        if 'metrics' in _exporters:
+            _observe(self.name, self.attrs.get('endpoint', ''), self.attrs.get('status', ''), duration_ms)
+        if self._otel_span is not None:
+            for key, value in self.attrs.items():
+                if value is not None:
+                    self._otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+            self._otel_context.__exit__(exc_type, exc, tb)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Returns a context manager timing one operation, e.g.
+        with tracing.span("ghl.request", endpoint="contact_lookup") as s:
+            ...
+            s.set(status=200)
+    When tracing is off this returns a shared no-op object.
+    """
+    if not _exporters:
+        return NOOP_SPAN
+    return Span(name, attrs)
+
+
+def traced_handler(func):
+    """
+    Decorator for HTTP entry points: reports each invocation as a "webhook" span tagged
+    with the entry point name, the locationID parameter and the response status.
+    """
+    @functools.wraps(func)
+    def wrapper(request):
+        trace = span("webhook", endpoint=func.__name__, location_id=request.args.get('locationID'))
+        if trace is NOOP_SPAN:
+            return func(request)
+        with trace:
+            result = func(request)
+            if isinstance(result, tuple):
+                trace.set(status=result[1])
+            return result
+    return wrapper
+
+
+def serves_metrics(func):
+    """
+    Decorator for HTTP entry points: a GET for METRICS_PATH is answered with
+    render_metrics() instead of running the entry point.
+    """
+    @functools.wraps(func)
+    def wrapper(request):
+        if METRICS_PATH and request.method == 'GET' and request.path == METRICS_PATH:
+            return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+        return func(request)
+    return wrapper
+
+
+def _observe(name, endpoint, status, duration_ms):
+    key = (name, str(endpoint), str(status))
+    with _metrics_lock:
+        entry = _metrics.get(key)
+        if entry is None:
+            entry = _metrics[key] = [0, 0.0, [0] * (len(LATENCY_BUCKETS_MS) + 1)]
+        entry[0] += 1
+        entry[1] += duration_ms
+        entry[2][bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+
+def render_metrics():
+    """
+    Returns the collected span metrics and the shared connection pool's reuse counters
+    (transport.pool_stats) in the Prometheus text exposition format. Metrics are per
+    function instance and labelled with a per-process instance id.
+    """
+    from . import transport
+    lines = [
+        "# TYPE vici_span_duration_ms histogram",
+    ]
+    with _metrics_lock:
+        items = sorted((key, (count, total, list(buckets))) for key, (count, total, buckets) in _metrics.items())
+    for (name, endpoint, status), (count, total, buckets) in items:
+        labels = f'instance="{_instance}",span="{name}",endpoint="{endpoint}",status="{status}"'
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, buckets):
+            cumulative += bucket_count
+            lines.append(f'vici_span_duration_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'vici_span_duration_ms_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'vici_span_duration_ms_sum{{{labels}}} {total:.3f}')
+        lines.append(f'vici_span_duration_ms_count{{{labels}}} {count}')
+    hosts = transport.pool_stats()['hosts']
+    for metric, field in (("vici_http_connections_opened", 'connections'), ("vici_http_requests_sent", 'requests'),
+                          ("vici_http_requests_reused", 'reused')):
+        lines.append(f"# TYPE {metric} counter")
+        for host, stats in sorted(hosts.items()):
+            lines.append(f'{metric}{{instance="{_instance}",host="{host}"}} {stats[field]}')
+    return "\n".join(lines) + "\n"
+
+
+configure(TRACE_EXPORTERS)
@@ -0,0 +1,101 @@
+import os
+import threading
+
+# Pool sizing and timeouts can be tuned per deployment through environment variables.
+# pool_connections is the number of per-host pools kept alive, pool_maxsize is the
+# number of keep-alive connections retained for each host.
+POOL_CONNECTIONS = int(os.environ.get('GHL_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.environ.get('GHL_POOL_MAXSIZE', '16'))
+CONNECT_TIMEOUT = float(os.environ.get('GHL_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.environ.get('GHL_READ_TIMEOUT', '20'))
+
+_lock = threading.Lock()
+_session = None
+_adapter = None
+_settings = {
+    'pool_connections': POOL_CONNECTIONS,
+    'pool_maxsize': POOL_MAXSIZE,
+    'connect_timeout': CONNECT_TIMEOUT,
+    'read_timeout': READ_TIMEOUT,
+}
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session used for every GHL call.
+    The session is created on first use and kept for the lifetime of the worker,
+    so warm invocations reuse keep-alive connections instead of new TLS handshakes.
+    requests (and urllib3) are imported here rather than with the module, to keep them
+    out of main.py's import.
+    """
+    global _session, _adapter
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                adapter = HTTPAdapter(pool_connections=_settings['pool_connections'],
+                                      pool_maxsize=_settings['pool_maxsize'])
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _adapter = adapter
+                _session = session
+    return _session
+
+
+def configure(pool_connections=None, pool_maxsize=None, connect_timeout=None, read_timeout=None):
+    """
+    Overrides the pool size and timeouts. The current session (if any) is closed
+    and a new one is built with the new settings on the next get_session() call.
+    """
+    global _session, _adapter
+    with _lock:
+        if pool_connections is not None:
+            _settings['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            _settings['pool_maxsize'] = pool_maxsize
+        if connect_timeout is not None:
+            _settings['connect_timeout'] = connect_timeout
+        if read_timeout is not None:
+            _settings['read_timeout'] = read_timeout
+        if _session is not None:
+            _session.close()
+        _session = None
+        _adapter = None
+
+
+def default_timeout():
+    """
+    Returns the (connect, read) timeout tuple passed to every request.
+    """
+    return (_settings['connect_timeout'], _settings['read_timeout'])
+
+
+def pool_stats():
+    """
+    Returns connection reuse counters for the shared pool.
+    'connections' is the number of TCP/TLS connections opened, 'requests' the number
+    of requests sent, and 'reused' how many requests went over an existing connection.
+    """
+    stats = {'connections': 0, 'requests': 0, 'reused': 0, 'hosts': {}}
+    adapter = _adapter
+    if adapter is None:
+        return stats
+    pools = adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = f"{pool.scheme}://{pool.host}"
+        connections = pool.num_connections
+        sent = pool.num_requests
+        stats['hosts'][host] = {
+            'connections': connections,
+            'requests': sent,
+            'reused': max(sent - connections, 0),
+        }
+        stats['connections'] += connections
+        stats['requests'] += sent
+    stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+    return stats
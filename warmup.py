@@ -0,0 +1,44 @@
+import os
+import logging
+import threading
+from . import tracing
+from . import transport
+from .config_cache import get_client
+
+# Heavy clients are built on first use (the Firestore client pulls in grpc and protobuf).
+# With STARTUP_WARMUP=1 (the default) a background thread builds them right after import,
+# so the instance can start serving while they load instead of importing them up front.
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '1') == '1'
+
+_thread = None
+_lock = threading.Lock()
+
+
+def _warm():
+    try:
+        with tracing.span("startup.warmup"):
+            get_client()
+            transport.get_session()
+    except Exception as e:
+        # The first request builds whatever failed here and reports the error itself.
+        logging.warning(f"Startup warm-up failed: {e}")
+
+
+def start():
+    """
+    Starts the background warm-up once per process and returns its thread.
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm, name="startup-warmup", daemon=True)
+            _thread.start()
+        return _thread
+
+
+def wait(timeout=None):
+    """
+    Blocks until the warm-up started by start() has finished (or timeout seconds passed).
+    """
+    if _thread is not None:
+        _thread.join(timeout)
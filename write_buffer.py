@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from cachetools import TTLCache
+from . import tracing
+
+# Updates for a known contact go through a per-contact buffer: writes that arrive within
+# WRITE_BUFFER_WINDOW seconds (or while the previous flush for the contact is still running)
+# are merged into one update_contact and one combined add_notes call, and the update only
+# carries fields that differ from the last-known contact state. That state is per instance
+# and other instances may have written the contact since, so fields that change with every
+# disposition (tags, the disposition custom field) are passed as `always` and always sent.
+WRITE_BUFFER_WINDOW = float(os.environ.get('WRITE_BUFFER_WINDOW', '0.2'))
+CONTACT_STATE_SIZE = int(os.environ.get('CONTACT_STATE_SIZE', '50000'))
+CONTACT_STATE_TTL = float(os.environ.get('CONTACT_STATE_TTL', '3600'))
+NOTE_SEPARATOR = "\n\n"
+
+EMPTY_VALUES = (None, '', [])
+
+
+def contact_state(contact):
+    """
+    Converts a GHL contact (as returned by contact_lookup) to the shape of an update
+    payload. GHL returns custom fields as a list of {"id", "value"} objects.
+    """
+    state = {key: value for key, value in contact.items() if key not in ('id', 'customField')}
+    custom_fields = contact.get('customField') or {}
+    if isinstance(custom_fields, list):
+        custom_fields = {field.get('id'): field.get('value') for field in custom_fields}
+    state['customField'] = dict(custom_fields)
+    return state
+
+
+class PendingWrite:
+    """
+    Merged update payload and notes for one contact, waiting to be flushed.
+    """
+
+    def __init__(self, app_instance, user_id, previous) -> None:
+        self.app_instance = app_instance
+        self.user_id = user_id
+        self.previous = previous
+        self.data = {}
+        self.custom_fields = {}
+        self.notes = []
+        self.always = set()
+        self.future = Future()
+
+    def merge(self, data, note, always=()):
+        # Later dispositions win, as they would if the writes ran one after the other.
+        for key, value in data.items():
+            if key == 'customField':
+                self.custom_fields.update(value)
+            else:
+                self.data[key] = value
+        if note:
+            self.notes.append(note)
+        self.always.update(always)
+
+    def payload(self):
+        if self.custom_fields:
+            return dict(self.data, customField=self.custom_fields)
+        return dict(self.data)
+
+
+class ContactWriteBuffer:
+
+    def __init__(self, window=WRITE_BUFFER_WINDOW, maxsize=CONTACT_STATE_SIZE, ttl=CONTACT_STATE_TTL) -> None:
+        self.window = window
+        self._known = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pending = {}
+        self._flushing = {}
+        self._lock = threading.Lock()
+
+    def write(self, app_instance, contact_id, data, note, user_id, window=None, always=()):
+        """
+        Queues an update and note for a contact and returns the add_notes response once
+        the merged write has been flushed. always lists fields (top-level names or custom
+        field ids) sent even when they match the last-known state. The first writer for a contact waits `window`
+        seconds (default: WRITE_BUFFER_WINDOW) and then flushes everything that was merged
+        in the meantime. Errors, e.g. ApiError(404) for a deleted contact, are raised in
+        every merged caller.
+        """
+        key = (app_instance.location_id, contact_id)
+        with self._lock:
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = PendingWrite(app_instance, user_id, self._flushing.get(key))
+            pending.merge(data, note, always)
+        if not leader:
+            logging.info(f"Write merged into pending flush: {contact_id}")
+            return pending.future.result()
+
+        window = self.window if window is None else window
+        if window > 0:
+            time.sleep(window)
+        if pending.previous is not None:
+            # Writes for one contact are flushed in order; the outcome of the previous
+            # flush belongs to its own callers.
+            pending.previous.exception()
+        with self._lock:
+            del self._pending[key]
+            self._flushing[key] = pending.future
+        try:
+            result = self._flush(key, pending)
+            pending.future.set_result(result)
+            return result
+        except BaseException as e:
+            pending.future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._flushing.get(key) is pending.future:
+                    del self._flushing[key]
+
+    def _flush(self, key, pending):
+        app_instance = pending.app_instance
+        contact_id = key[1]
+        changes = self.diff(key, pending.payload(), pending.always)
+        with tracing.span("write_buffer.flush", location=key[0], notes=len(pending.notes),
+                          fields=len(changes)):
+            if changes:
+                try:
+                    app_instance.update_contact(contact_id, changes)
+                except Exception:
+                    self.forget(*key)
+                    raise
+                self.remember(key[0], contact_id, changes)
+                logging.info(f"Contact updated: {contact_id} ({len(changes)} changed fields)")
+            else:
+                logging.info(f"Contact unchanged, update skipped: {contact_id}")
+            if not pending.notes:
+                return None
+            return app_instance.add_notes(contact_id, NOTE_SEPARATOR.join(pending.notes), pending.user_id)
+
+    def diff(self, key, data, always=()):
+        """
+        Returns the part of an update payload that differs from the last-known state of
+        the contact, plus the fields listed in always. Empty values are dropped so an
+        update never clears a field.
+        """
+        with self._lock:
+            known = self._known.get(key) or {}
+        changes = {}
+        for field, value in data.items():
+            if field == 'customField':
+                known_fields = known.get('customField', {})
+                custom_fields = {field_id: v for field_id, v in value.items()
+                                 if v not in EMPTY_VALUES and (field_id in always or known_fields.get(field_id) != v)}
+                if custom_fields:
+                    changes['customField'] = custom_fields
+            elif value not in EMPTY_VALUES and (field in always or known.get(field) != value):
+                changes[field] = value
+        return changes
+
+    def remember(self, location_id, contact_id, data):
+        """
+        Records fields GHL is known to hold for a contact (after a create, update or lookup).
+        """
+        key = (location_id, contact_id)
+        with self._lock:
+            known = dict(self._known.get(key) or {})
+            for field, value in data.items():
+                if field == 'customField':
+                    known['customField'] = dict(known.get('customField', {}), **value)
+                else:
+                    known[field] = value
+            self._known[key] = known
+
+    def forget(self, location_id, contact_id):
+        with self._lock:
+            self._known.pop((location_id, contact_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+
+
+contact_writes = ContactWriteBuffer()